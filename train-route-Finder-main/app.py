@@ -1,9 +1,11 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import logging
 from datetime import datetime, timedelta
-from route_finder import find_routes, print_routes  
+from route_finder import find_routes, find_routes_batch, find_routes_window, iter_routes, print_routes  
 from train_availability_scraper import scrape_train_data
 from train_route_scraper import scrape_train_routes
+from driver_pool import driver_pool
+from search_coalescer import SearchCoalescer
 from pyngrok import ngrok, conf
 import os
 import atexit
@@ -39,6 +41,9 @@ CORS(app, resources={
 # Global variable to store ngrok tunnel
 tunnel = None
 
+# Identical searches running at the same time share one find_routes run
+search_coalescer = SearchCoalescer()
+
 def cleanup_ngrok():
     """Cleanup function to kill ngrok process"""
     global tunnel
@@ -550,6 +555,7 @@ def index():
         date = request.form.get('date', datetime.now().strftime('%Y-%m-%d'))
         max_routes = int(request.form.get('max_routes', 5))
         min_connection_time = int(request.form.get('connection_time', 30))
+        flex_days = int(request.form.get('flex_days', 0))
         
         print(f"Processing route from {origin} to {destination} on {date}")
         
@@ -557,14 +563,39 @@ def index():
         date = date.replace('-', '')
         
         try:
-            # Find routes
-            routes = find_routes(
-                origin=origin,
-                destination=destination,
-                date=date,
-                scrape_availability=scrape_train_data,
-                scrape_routes=scrape_train_routes,
-                max_routes=max_routes
+            def run_search(on_route):
+                if not flex_days:
+                    return find_routes(
+                        origin=origin,
+                        destination=destination,
+                        date=date,
+                        scrape_availability=scrape_train_data,
+                        scrape_routes=scrape_train_routes,
+                        max_routes=max_routes,
+                        min_connection_time=min_connection_time,
+                        on_route=on_route
+                    )
+                # Search the whole date window at once, sharing scraped pages between days
+                routes_by_date = find_routes_window(
+                    origin, destination, date,
+                    scrape_availability=scrape_train_data,
+                    scrape_routes=scrape_train_routes,
+                    days=flex_days + 1,
+                    max_routes=max_routes,
+                    min_connection_time=min_connection_time,
+                    on_route=on_route
+                )
+                window_routes = []
+                for search_date, day_routes in routes_by_date.items():
+                    for route in day_routes:
+                        route['search_date'] = search_date
+                        window_routes.append(route)
+                return window_routes
+            
+            # Find routes, joining an identical search if one is already running
+            routes = search_coalescer.search(
+                (origin, destination, date, max_routes, min_connection_time, flex_days),
+                run_search
             )
             
             print(f"Found {len(routes)} routes")
@@ -679,6 +710,102 @@ def index():
     # This should never happen, but just in case
     return render_template('error.html', error="Invalid request method")
 
+def serialize_route(route):
+    """Convert a route to JSON-friendly data (datetimes as ISO strings)"""
+    segments = []
+    for segment in route.get('segments', []):
+        segments.append({
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in segment.items()
+        })
+    return {'segments': segments}
+
+@app.route('/api/search/stream', methods=['GET'])
+def search_stream():
+    """Server-Sent Events endpoint pushing routes to the browser as they are found"""
+    origin = request.args.get('origin')
+    destination = request.args.get('destination')
+    if not origin or not destination:
+        return jsonify({"error": "origin and destination are required"}), 400
+    
+    date = request.args.get('date', datetime.now().strftime('%Y-%m-%d')).replace('-', '')
+    try:
+        max_routes = int(request.args.get('max_routes', 5))
+    except ValueError:
+        return jsonify({"error": "max_routes must be an integer"}), 400
+    if max_routes < 1:
+        return jsonify({"error": "max_routes must be positive"}), 400
+    
+    def generate():
+        count = 0
+        try:
+            for route in iter_routes(
+                origin, destination, date,
+                scrape_availability=scrape_train_data,
+                scrape_routes=scrape_train_routes,
+                max_routes=max_routes
+            ):
+                count += 1
+                yield f"event: route\ndata: {json.dumps(serialize_route(route))}\n\n"
+        except Exception as e:
+            print(f"Error streaming routes: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        yield f"event: done\ndata: {json.dumps({'count': count})}\n\n"
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Upper limits on queries accepted by one batch request and on its running time
+MAX_BATCH_QUERIES = 100
+BATCH_TIMEOUT = 600
+
+@app.route('/api/search/batch', methods=['POST'])
+def search_batch():
+    """Run many route searches in one request, sharing scraped pages between them"""
+    data = request.get_json(silent=True) or {}
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "queries must be a non-empty list"}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"at most {MAX_BATCH_QUERIES} queries per batch"}), 400
+    
+    parsed = []
+    for query in queries:
+        if not isinstance(query, dict) or not query.get('origin') or not query.get('destination'):
+            return jsonify({"error": "each query needs origin and destination"}), 400
+        date = str(query.get('date', datetime.now().strftime('%Y-%m-%d'))).replace('-', '')
+        parsed.append((query['origin'], query['destination'], date))
+    
+    try:
+        max_routes = int(data.get('max_routes', 1))
+        connection_time = int(data.get('connection_time', 30))
+        query_timeout = data.get('query_timeout')
+        query_timeout = None if query_timeout is None else float(query_timeout)
+    except (TypeError, ValueError):
+        return jsonify({"error": "max_routes and connection_time must be integers and query_timeout a number"}), 400
+    if max_routes < 1 or connection_time < 0 or (query_timeout is not None and query_timeout <= 0):
+        return jsonify({"error": "max_routes and query_timeout must be positive and connection_time not negative"}), 400
+    
+    try:
+        results = find_routes_batch(
+            parsed,
+            scrape_availability=scrape_train_data,
+            scrape_routes=scrape_train_routes,
+            max_routes=max_routes,
+            min_connection_time=connection_time,
+            timeout=BATCH_TIMEOUT,
+            query_timeout=min(query_timeout, BATCH_TIMEOUT) if query_timeout else None
+        )
+    except Exception as e:
+        print(f"Error running batch search: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    
+    for result in results:
+        result['routes'] = [serialize_route(route) for route in result['routes']]
+    return jsonify({"results": results})
+
 # New endpoint to get Azure Speech token
 @app.route('/api/get-speech-token', methods=['GET', 'OPTIONS'])
 def get_speech_token():
@@ -1014,6 +1141,9 @@ def run_app():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
+    # Start browsers now so the first searches do not wait for Chrome
+    driver_pool.warm_up()
+    
     # Initialize ngrok
     if init_ngrok():
         # Run the Flask app with reloader disabled
@@ -0,0 +1,90 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (max days until travel, TTL in seconds): seats near the travel date move fastest
+DEFAULT_TTL_TIERS: List[Tuple[int, int]] = [
+    (1, 60),
+    (7, 300),
+    (30, 900),
+]
+DEFAULT_MAX_TTL = 1800
+
+class AvailabilityCache:
+    """
+    Process-wide LRU cache of scraped seat availability keyed by
+    (from_station, to_station, date). Entries expire after a TTL that
+    grows with how far away the travel date is.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_tiers: Optional[List[Tuple[int, int]]] = None,
+                 max_ttl: int = DEFAULT_MAX_TTL):
+        self.max_entries = max_entries
+        self.ttl_tiers = sorted(ttl_tiers or DEFAULT_TTL_TIERS)
+        self.max_ttl = max_ttl
+        self.entries: "OrderedDict[Tuple[str, str, str], Tuple[float, List[dict]]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def ttl_for(self, date: str) -> int:
+        """TTL in seconds for a travel date in YYYYMMDD format"""
+        try:
+            days_ahead = (datetime.strptime(date, "%Y%m%d").date() - datetime.now().date()).days
+        except ValueError:
+            return self.ttl_tiers[0][1] if self.ttl_tiers else self.max_ttl
+        for max_days, ttl in self.ttl_tiers:
+            if days_ahead <= max_days:
+                return ttl
+        return self.max_ttl
+
+    def get(self, from_station: str, to_station: str, date: str) -> Optional[List[dict]]:
+        """Get cached trains for a search, or None if missing or expired"""
+        key = (from_station, to_station, date)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                logger.debug(f"✗ Availability cache miss for {from_station} -> {to_station} on {date}")
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        logger.info(f"✓ Availability cache hit for {from_station} -> {to_station} on {date} "
+                    f"(hits: {self.hits}, misses: {self.misses})")
+        return list(entry[1])
+
+    def put(self, from_station: str, to_station: str, date: str, trains: List[dict]):
+        """Store trains for a search, evicting the least recently used entries"""
+        key = (from_station, to_station, date)
+        expires_at = time.monotonic() + self.ttl_for(date)
+        with self.lock:
+            self.entries[key] = (expires_at, list(trains))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, from_station: str = None, to_station: str = None, date: str = None):
+        """Drop one entry, or everything when called without arguments"""
+        with self.lock:
+            if from_station is None:
+                self.entries.clear()
+            else:
+                self.entries.pop((from_station, to_station, date), None)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get cache statistics"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries)
+        }
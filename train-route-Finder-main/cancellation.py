@@ -0,0 +1,110 @@
+import functools
+import inspect
+import logging
+import threading
+import time
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class SearchCancelled(Exception):
+    """Raised inside a scrape when its search was cancelled or ran out of time"""
+
+class CancelToken:
+    """
+    Deadline and cancellation flag for one search, passed down into the
+    scrapers so page loads, waits and sleeps give up quickly. A token with a
+    parent is cancelled whenever the parent is, but cancelling it leaves the
+    parent alone. Also usable wherever a threading.Event stop flag is expected.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, parent: Optional['CancelToken'] = None):
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.parent = parent
+        self.event = threading.Event()
+        self.reason: Optional[str] = None
+        self.callbacks: List[Callable[[], None]] = []
+        self.lock = threading.Lock()
+        if parent is not None:
+            if parent.deadline is not None and (self.deadline is None or parent.deadline < self.deadline):
+                self.deadline = parent.deadline
+            parent.add_callback(lambda: self.cancel(parent.reason or "parent cancelled"))
+
+    def cancel(self, reason: str = "cancelled"):
+        """Cancel the search and run registered callbacks once"""
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.reason = reason
+            self.event.set()
+            callbacks = list(self.callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error in cancellation callback: {str(e)}")
+
+    def add_callback(self, callback: Callable[[], None]):
+        """Run callback when the token is cancelled (immediately if it already is)"""
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def is_cancelled(self) -> bool:
+        if self.event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline exceeded")
+            return True
+        return False
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the deadline, or None if there is no deadline"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def timeout_for(self, seconds: float, minimum: float = 1.0) -> float:
+        """Clamp a wait or page-load timeout to the time left before the deadline"""
+        remaining = self.remaining()
+        if remaining is None:
+            return seconds
+        return max(minimum, min(seconds, remaining))
+
+    def sleep(self, seconds: float) -> bool:
+        """Sleep unless cancelled first; returns False if the token was cancelled"""
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        self.event.wait(seconds)
+        return not self.is_cancelled()
+
+    def raise_if_cancelled(self):
+        if self.is_cancelled():
+            raise SearchCancelled(self.reason or "cancelled")
+
+    # threading.Event compatible interface, so a token can stand in for stop_event
+    def is_set(self) -> bool:
+        return self.is_cancelled()
+
+    def set(self):
+        self.cancel()
+
+def pause(seconds: float, cancel_token: Optional[CancelToken] = None) -> bool:
+    """time.sleep that wakes up early on cancellation; returns False if cancelled"""
+    if cancel_token is None:
+        time.sleep(seconds)
+        return True
+    return cancel_token.sleep(seconds)
+
+def bind_cancel_token(scrape_fn: Callable, cancel_token: CancelToken) -> Callable:
+    """Pass cancel_token to a scrape function if it accepts one"""
+    try:
+        parameters = inspect.signature(scrape_fn).parameters.values()
+    except (TypeError, ValueError):
+        return scrape_fn
+    if any(p.name == 'cancel_token' or p.kind == inspect.Parameter.VAR_KEYWORD for p in parameters):
+        return functools.partial(scrape_fn, cancel_token=cancel_token)
+    return scrape_fn
@@ -5,6 +5,7 @@ import gc
 import threading
 import os
 import concurrent.futures
+import functools
 from datetime import datetime, timedelta
 from typing import List, Tuple
 from concurrent.futures import ThreadPoolExecutor, TimeoutError
@@ -19,8 +20,11 @@ except ImportError:
 
 # Import your modules
 from train_availability_scraper import scrape_train_data as scrape_availability
-from train_route_scraper import scrape_train_routes as scrape_routes
-from route_finder import find_routes, print_routes
+from train_route_scraper import HARVEST_LIMIT, scrape_train_routes as scrape_routes
+from route_finder import find_routes, find_routes_batch, print_routes
+from cancellation import CancelToken
+from driver_pool import driver_pool
+from rate_limiter import rate_limiter
 
 # Station data - common Indian railway stations
 # Format: CODE_StationName
@@ -105,18 +109,25 @@ def generate_station_pairs(num_pairs: int) -> List[Tuple[str, str, str]]:
 # Cross-platform timeout function using ThreadPoolExecutor
 def find_routes_with_timeout(origin, destination, date, scrape_availability_func, 
                             scrape_routes_func, max_routes=1, timeout_seconds=120):
-    """Run find_routes with a timeout using ThreadPoolExecutor"""
+    """
+    Run find_routes with a timeout using ThreadPoolExecutor.
+    The timeout is also passed down as a cancellation deadline, so the
+    scrapers stop loading pages and free their browsers when it expires.
+    """
+    cancel_token = CancelToken(timeout=timeout_seconds)
     with ThreadPoolExecutor(max_workers=1) as executor:
         future = executor.submit(
             find_routes, 
             origin, destination, date, 
             scrape_availability_func, scrape_routes_func, 
-            max_routes=max_routes
+            max_routes=max_routes,
+            cancel_token=cancel_token
         )
         try:
             return future.result(timeout=timeout_seconds)
         except concurrent.futures.TimeoutError:
-            # This will cancel the future if possible
+            # Cancel the search so the executor can shut down promptly
+            cancel_token.cancel("timed out")
             future.cancel()
             raise TimeoutError(f"Route finding timed out after {timeout_seconds} seconds")
 
@@ -167,8 +178,9 @@ def run_station_tests(num_pairs: int, delay: int, max_routes: int = 1, timeout_s
         print("Cleaning up resources...")
         cleanup_resources()
         
-        # Wait before the next request to avoid overwhelming the server
-        if i < num_pairs:
+        # Request pacing is handled by the scrapers' rate limiter; this is
+        # only an extra pause between tests when one is asked for
+        if delay and i < num_pairs:
             print(f"Waiting {delay} seconds before next test...")
             time.sleep(delay)
 
@@ -201,23 +213,62 @@ def run_specific_pairs(pairs, delay, max_routes=1, timeout_seconds=120):
         print("Cleaning up resources...")
         cleanup_resources()
         
-        if i < len(pairs):
+        if delay and i < len(pairs):
             print(f"Waiting {delay} seconds before next test...")
             time.sleep(delay)
 
 
+def run_batch(pairs, max_routes=1, timeout_seconds=120, parallel=4):
+    """Run all pairs as one batch, sharing scraped pages between overlapping searches"""
+    print(f"Testing {len(pairs)} station pairs as one batch with {parallel} parallel searches")
+    start = time.time()
+    
+    results = find_routes_batch(
+        pairs, scrape_availability, scrape_routes,
+        max_routes=max_routes,
+        max_parallel=parallel,
+        query_timeout=timeout_seconds
+    )
+    
+    for i, result in enumerate(results, 1):
+        print(f"\nTest {i}/{len(results)}: {result['origin']} -> {result['destination']} on {result['date']}")
+        if result['error']:
+            print(f"Error finding routes: {result['error']}")
+        else:
+            print_routes(result['routes'])
+        print("-" * 50)
+    
+    found = sum(1 for result in results if result['routes'])
+    print(f"Batch finished in {time.time() - start:.1f} seconds, {found}/{len(results)} pairs with routes")
+    cleanup_resources()
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Test different station combinations")
     parser.add_argument("--pairs", type=int, default=100, help="Number of random station pairs to test")
-    parser.add_argument("--delay", type=int, default=300, help="Delay between tests in seconds")
+    parser.add_argument("--delay", type=int, default=0,
+                      help="Extra delay between tests in seconds; requests are already rate limited")
     parser.add_argument("--routes", type=int, default=1, help="Maximum routes to find per pair")
-    parser.add_argument("--mode", choices=["random", "specific"], default="random", 
-                      help="Mode: 'random' for random pairs, 'specific' for predefined pairs")
+    parser.add_argument("--mode", choices=["random", "specific", "batch"], default="random", 
+                      help="Mode: 'random' for random pairs, 'specific' for predefined pairs, "
+                           "'batch' for random pairs searched together")
+    parser.add_argument("--parallel", type=int, default=4, help="Parallel searches in batch mode")
     parser.add_argument("--timeout", type=int, default=120, help="Timeout in seconds for each route finding")
+    parser.add_argument("--harvest", action="store_true",
+                      help="Also store the stops of every train on the pages visited")
     args = parser.parse_args()
     
+    if args.harvest:
+        scrape_availability = functools.partial(scrape_availability, harvest_stops=True)
+        scrape_routes = functools.partial(scrape_routes, harvest_limit=HARVEST_LIMIT)
+    
+    # Start browsers while the pairs are being set up
+    driver_pool.warm_up()
+    
     if args.mode == "random":
         run_station_tests(args.pairs, args.delay, args.routes, args.timeout)
+    elif args.mode == "batch":
+        run_batch(generate_station_pairs(args.pairs), args.routes, args.timeout, args.parallel)
     else:
         # Define specific station pairs to test
         specific_pairs = [
@@ -243,5 +294,7 @@ if __name__ == "__main__":
     
     # Final cleanup
     print("\nFinal resource cleanup...")
+    print(f"Driver pool stats: {driver_pool.get_stats()}")
+    print(f"Rate limiter stats: {rate_limiter.get_stats()}")
     cleanup_resources()
     print("All tests completed.")
\ No newline at end of file
@@ -0,0 +1,301 @@
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+import atexit
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from cancellation import CancelToken, SearchCancelled, pause
+
+# RSS based recycling needs psutil; page-load recycling works without it
+try:
+    import psutil
+    has_psutil = True
+except ImportError:
+    has_psutil = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = int(os.environ.get('DRIVER_POOL_SIZE', 4))
+DEFAULT_MAX_PAGE_LOADS = int(os.environ.get('DRIVER_MAX_PAGE_LOADS', 50))
+DEFAULT_MAX_RSS_MB = int(os.environ.get('DRIVER_MAX_RSS_MB', 1024))
+
+# Requests Chrome never makes for the search pages: the train list only
+# needs the document, its scripts and the API calls. Set
+# DRIVER_BLOCK_RESOURCES=0 to load pages in full while debugging selectors.
+BLOCK_RESOURCES = os.environ.get('DRIVER_BLOCK_RESOURCES', '1') != '0'
+BLOCKED_URL_PATTERNS = [
+    # Images and media
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.mp4", "*.webm", "*.mp3",
+    # Fonts
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    # Analytics, tag managers and ads
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*facebook.net*", "*connect.facebook.com*",
+    "*hotjar.com*", "*clevertap*", "*branch.io*", "*sentry.io*", "*newrelic.com*", "*nr-data.net*",
+] + [pattern for pattern in os.environ.get('DRIVER_BLOCKED_URLS', '').split(',') if pattern]
+
+def get_random_user_agent():
+    user_agents = [
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15",
+    ]
+    return random.choice(user_agents)
+
+def create_driver(block_resources: bool = BLOCK_RESOURCES,
+                  blocked_urls: Optional[List[str]] = None) -> webdriver.Chrome:
+    """
+    Start a headless Chrome configured for the Paytm search pages. Page
+    loads return once the DOM is ready (eager strategy); callers wait for
+    the elements they need. With block_resources, images, media, fonts and
+    tracking requests are dropped through CDP before they are sent.
+    """
+    options = Options()
+    options.page_load_strategy = 'eager'
+    options.add_argument("--headless")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument(f"user-agent={get_random_user_agent()}")
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option('useAutomationExtension', False)
+
+    if block_resources:
+        options.add_argument("--blink-settings=imagesEnabled=false")
+
+    driver = webdriver.Chrome(options=options)
+    driver.set_page_load_timeout(30)
+    if block_resources:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_urls or BLOCKED_URL_PATTERNS})
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+        "source": """
+            Object.defineProperty(navigator, 'webdriver', {
+                get: () => undefined
+            })
+        """
+    })
+    return driver
+
+def wait_for_stable_count(driver, class_name: str, cancel_token: Optional[CancelToken] = None,
+                          timeout: float = 2.0, poll: float = 0.25) -> int:
+    """
+    Wait until the number of elements with class_name stops changing, for
+    lists that keep rendering after their first items appear. Replaces the
+    fixed sleeps after scrolling.
+    """
+    deadline = time.monotonic() + timeout
+    last = -1
+    while True:
+        count = driver.execute_script("return document.getElementsByClassName(arguments[0]).length;", class_name)
+        if count == last or time.monotonic() >= deadline:
+            return count
+        last = count
+        if not pause(poll, cancel_token):
+            raise SearchCancelled(cancel_token.reason or "cancelled")
+
+class PooledDriver:
+    """A browser owned by the pool, with the bookkeeping used to recycle it"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.created_at = time.monotonic()
+        self.page_loads = 0
+        self.healthy = True
+
+    def rss_mb(self) -> Optional[float]:
+        """Resident memory of chromedriver and its Chrome processes, if psutil is available"""
+        if not has_psutil:
+            return None
+        try:
+            process = psutil.Process(self.driver.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / 1024 / 1024
+        except Exception:
+            return None
+
+class DriverPool:
+    """
+    Bounded pool of Chrome instances shared by both scrapers. Drivers are
+    leased for one page load and returned, health-checked on lease, and
+    replaced after max_page_loads loads or once their memory passes
+    max_rss_mb. warm_up() starts drivers ahead of time so searches do not
+    pay Chrome's start-up cost.
+    """
+
+    def __init__(self, size: int = DEFAULT_POOL_SIZE, max_page_loads: int = DEFAULT_MAX_PAGE_LOADS,
+                 max_rss_mb: int = DEFAULT_MAX_RSS_MB, driver_factory: Callable = create_driver):
+        self.size = size
+        self.max_page_loads = max_page_loads
+        self.max_rss_mb = max_rss_mb
+        self.driver_factory = driver_factory
+        self.idle: List[PooledDriver] = []
+        self.total = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.stats = {
+            'created': 0,
+            'recycled': 0,
+            'leases': 0,
+            'waits': 0,
+            'health_failures': 0,
+            'create_failures': 0
+        }
+
+    def _create(self) -> PooledDriver:
+        """Start a browser for a slot already counted in total"""
+        try:
+            started = time.monotonic()
+            pooled = PooledDriver(self.driver_factory())
+        except Exception:
+            with self.condition:
+                self.total -= 1
+                self.stats['create_failures'] += 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.stats['created'] += 1
+        logger.info(f"✓ Started browser in {time.monotonic() - started:.1f}s ({self.total}/{self.size} in pool)")
+        return pooled
+
+    def warm_up(self, count: Optional[int] = None, background: bool = True):
+        """Start up to `count` drivers (default: the pool size) before they are needed"""
+        count = min(count or self.size, self.size)
+
+        def start_drivers():
+            for _ in range(count):
+                with self.condition:
+                    if self.closed or self.total >= count:
+                        return
+                    self.total += 1
+                try:
+                    pooled = self._create()
+                except Exception as e:
+                    logger.error(f"✗ Browser warm-up failed: {str(e)}")
+                    return
+                self._return(pooled)
+
+        if background:
+            threading.Thread(target=start_drivers, name="DriverWarmUp", daemon=True).start()
+        else:
+            start_drivers()
+
+    def acquire(self, cancel_token: Optional[CancelToken] = None, timeout: float = 300) -> PooledDriver:
+        """Lease a healthy driver, waiting for one to be returned if the pool is full"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.condition:
+                waited = False
+                while not self.idle and self.total >= self.size:
+                    if self.closed:
+                        raise RuntimeError("Driver pool is closed")
+                    if cancel_token and cancel_token.is_cancelled():
+                        raise SearchCancelled(cancel_token.reason or "cancelled")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("Timed out waiting for a browser from the pool")
+                    if not waited:
+                        self.stats['waits'] += 1
+                        waited = True
+                    self.condition.wait(min(1.0, remaining))
+                if self.closed:
+                    raise RuntimeError("Driver pool is closed")
+                pooled = self.idle.pop() if self.idle else None
+                if pooled is None:
+                    self.total += 1
+                self.stats['leases'] += 1
+
+            if pooled is None:
+                return self._create()
+            if self._is_healthy(pooled):
+                return pooled
+            with self.condition:
+                self.stats['health_failures'] += 1
+            self._discard(pooled)
+
+    def release(self, pooled: PooledDriver):
+        """Return a leased driver, recycling it if it is unhealthy, worn out or too large"""
+        pooled.page_loads += 1
+        reason = None
+        if not pooled.healthy:
+            reason = "unhealthy"
+        elif pooled.page_loads >= self.max_page_loads:
+            reason = f"{pooled.page_loads} page loads"
+        else:
+            rss = pooled.rss_mb()
+            if rss is not None and rss > self.max_rss_mb:
+                reason = f"RSS {rss:.0f} MB"
+
+        if reason or self.closed:
+            if reason:
+                logger.info(f"Recycling browser after {reason}")
+                with self.condition:
+                    self.stats['recycled'] += 1
+            self._discard(pooled)
+            return
+        self._return(pooled)
+
+    @contextmanager
+    def driver(self, cancel_token: Optional[CancelToken] = None):
+        """Lease a driver for the duration of a with block"""
+        pooled = self.acquire(cancel_token)
+        try:
+            yield pooled.driver
+        finally:
+            self.release(pooled)
+
+    def _is_healthy(self, pooled: PooledDriver) -> bool:
+        try:
+            pooled.driver.execute_script("return 1;")
+            return True
+        except Exception as e:
+            logger.warning(f"Browser failed health check: {str(e)}")
+            return False
+
+    def _return(self, pooled: PooledDriver):
+        with self.condition:
+            if not self.closed:
+                self.idle.append(pooled)
+                self.condition.notify()
+                return
+        self._discard(pooled)
+
+    def _discard(self, pooled: PooledDriver):
+        try:
+            pooled.driver.quit()
+        except Exception:
+            pass
+        with self.condition:
+            self.total -= 1
+            self.condition.notify()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get pool metrics"""
+        with self.condition:
+            stats = dict(self.stats)
+            stats.update({
+                'size': self.size,
+                'total': self.total,
+                'idle': len(self.idle),
+                'in_use': self.total - len(self.idle)
+            })
+        return stats
+
+    def close(self):
+        """Quit idle drivers; leased drivers are quit when they are returned"""
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.condition.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+        logger.info(f"Driver pool closed: {self.get_stats()}")
+
+# Shared by the availability and route scrapers
+driver_pool = DriverPool()
+atexit.register(driver_pool.close)
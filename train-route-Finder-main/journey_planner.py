@@ -0,0 +1,223 @@
+import bisect
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from train_stops_store import MINUTES_PER_DAY, NO_TIME, TrainStopsStore
+
+logger = logging.getLogger(__name__)
+
+INFINITY = float('inf')
+
+class Connection(NamedTuple):
+    """A train running between two consecutive stops, times in minutes from search day 00:00"""
+    departure: int
+    arrival: int
+    from_code: str
+    to_code: str
+    trip: int
+    train_number: str
+
+class JourneyLeg(NamedTuple):
+    """One train ridden from boarding to alighting station"""
+    train_number: str
+    from_code: str
+    to_code: str
+    departure_minute: int
+    arrival_minute: int
+
+    def departure_datetime(self, date_str: str) -> datetime:
+        return datetime.strptime(date_str, "%Y%m%d") + timedelta(minutes=self.departure_minute)
+
+    def arrival_datetime(self, date_str: str) -> datetime:
+        return datetime.strptime(date_str, "%Y%m%d") + timedelta(minutes=self.arrival_minute)
+
+class Journey(NamedTuple):
+    """An itinerary proposed by the planner"""
+    legs: List[JourneyLeg]
+
+    @property
+    def arrival_minute(self) -> int:
+        return self.legs[-1].arrival_minute
+
+    @property
+    def departure_minute(self) -> int:
+        return self.legs[0].departure_minute
+
+    @property
+    def transfers(self) -> int:
+        return len(self.legs) - 1
+
+    @property
+    def transfer_stations(self) -> List[str]:
+        return [leg.to_code for leg in self.legs[:-1]]
+
+class JourneyPlanner:
+    """
+    Connection Scan planner over the connections implied by stored train
+    stops. Every stored train is assumed to run daily, so the timetable is
+    unrolled over a few days once and each query is a single forward scan
+    with one arrival label per number of trains used.
+    """
+
+    def __init__(self, store: TrainStopsStore, min_connection_time: int = 30,
+                 days_before: int = 2, days_after: int = 3):
+        self.store = store
+        self.min_connection_time = min_connection_time
+        self.days_before = days_before
+        self.days_after = days_after
+        self.connections: List[Connection] = []
+        self.departures: List[int] = []
+        self.dirty = True
+        self.lock = threading.Lock()
+        store.add_listener(self._on_store_update)
+
+    def _on_store_update(self, train_number: str, stops: List[dict]):
+        self.dirty = True
+
+    def _build(self):
+        """Unroll every stored train into a departure-sorted connection list"""
+        days = range(-self.days_before, self.days_after + 1)
+        connections = []
+        for train_idx, (train_number, timetable) in enumerate(list(self.store.timetables.items())):
+            if timetable.start_minute == NO_TIME or len(timetable.station_codes) < 2:
+                continue
+            codes = timetable.station_codes
+            for day_idx, day in enumerate(days):
+                base = day * MINUTES_PER_DAY + timetable.start_minute
+                trip = train_idx * len(days) + day_idx
+                for i in range(len(codes) - 1):
+                    departure = timetable.departure_minutes[i]
+                    arrival = timetable.arrival_minutes[i + 1]
+                    from_code = codes[i]
+                    to_code = codes[i + 1]
+                    if departure == NO_TIME or arrival == NO_TIME or not from_code or not to_code:
+                        continue
+                    connections.append(Connection(
+                        base + departure, base + arrival, from_code, to_code, trip, train_number
+                    ))
+        connections.sort()
+        self.connections = connections
+        self.departures = [c.departure for c in connections]
+        self.dirty = False
+        logger.info(f"✓ Journey planner built {len(connections)} connections")
+
+    def _ensure_built(self):
+        if self.dirty:
+            with self.lock:
+                if self.dirty:
+                    self._build()
+
+    def plan(self, origin_code: str, dest_code: str, max_transfers: int = 2,
+             depart_after: int = 0, max_journey_minutes: int = 2 * MINUTES_PER_DAY,
+             excluded_transfers: Optional[Set[str]] = None, min_transfers: int = 0) -> List[Journey]:
+        """
+        Pareto-optimal journeys (earliest arrival per number of transfers)
+        from origin to destination, fewest transfers first.
+
+        Args:
+            origin_code: Boarding station code
+            dest_code: Destination station code
+            max_transfers: Maximum number of changes between trains
+            depart_after: Earliest departure, in minutes from search day 00:00
+            max_journey_minutes: Stop scanning connections departing later than this
+            excluded_transfers: Stations where changing trains is not allowed
+            min_transfers: Leave out journeys with fewer changes, so they cannot dominate the rest
+        """
+        self._ensure_built()
+        connections = self.connections
+        excluded_transfers = excluded_transfers or set()
+        levels = max_transfers + 1
+        change = self.min_connection_time
+
+        # arrivals[k][station]: earliest arrival using exactly k trains
+        arrivals: List[Dict[str, float]] = [dict() for _ in range(levels + 1)]
+        arrivals[0][origin_code] = depart_after
+        parents: List[Dict[str, Tuple[Connection, Connection]]] = [dict() for _ in range(levels + 1)]
+        trip_level: Dict[int, int] = {}
+        trip_entry: Dict[int, Connection] = {}
+
+        last_departure = depart_after + max_journey_minutes
+        start = bisect.bisect_left(self.departures, depart_after)
+        for idx in range(start, len(connections)):
+            c = connections[idx]
+            if c.departure > last_departure:
+                break
+
+            level = trip_level.get(c.trip)
+            for k in range(1, (level or levels + 1)):
+                ready = arrivals[k - 1].get(c.from_code)
+                if ready is None:
+                    continue
+                if k > 1:
+                    if c.from_code in excluded_transfers:
+                        continue
+                    ready += change
+                if ready <= c.departure:
+                    trip_level[c.trip] = k
+                    trip_entry[c.trip] = c
+                    level = k
+                    break
+
+            if level is None:
+                continue
+            if c.arrival < arrivals[level].get(c.to_code, INFINITY):
+                arrivals[level][c.to_code] = c.arrival
+                parents[level][c.to_code] = (trip_entry[c.trip], c)
+
+        journeys = []
+        best = INFINITY
+        for k in range(min_transfers + 1, levels + 1):
+            arrival = arrivals[k].get(dest_code)
+            if arrival is None or arrival >= best:
+                continue
+            best = arrival
+            journeys.append(self._reconstruct(parents, k, dest_code))
+        return journeys
+
+    def _reconstruct(self, parents, level: int, dest_code: str) -> Journey:
+        legs = []
+        station = dest_code
+        for k in range(level, 0, -1):
+            entry, exit_conn = parents[k][station]
+            legs.append(JourneyLeg(
+                entry.train_number, entry.from_code, station, entry.departure, exit_conn.arrival
+            ))
+            station = entry.from_code
+        legs.reverse()
+        return Journey(legs)
+
+    def earliest_arrival(self, origin_code: str, dest_code: str, **kwargs) -> Optional[Journey]:
+        """Journey arriving first, regardless of transfers"""
+        journeys = self.plan(origin_code, dest_code, **kwargs)
+        return min(journeys, key=lambda j: j.arrival_minute) if journeys else None
+
+    def fewest_transfers(self, origin_code: str, dest_code: str, **kwargs) -> Optional[Journey]:
+        """Journey with the fewest changes, earliest arriving among those"""
+        journeys = self.plan(origin_code, dest_code, **kwargs)
+        return journeys[0] if journeys else None
+
+    def alternatives(self, origin_code: str, dest_code: str, limit: int = 5,
+                     max_transfers: int = 1, **kwargs) -> List[Journey]:
+        """
+        Up to `limit` journeys with at least one transfer, each changing at a
+        different station. Each round re-plans with the previous transfer
+        stations excluded. Direct trains are left out of the plan, so a
+        faster direct train does not hide the transfer journeys.
+        """
+        excluded: Set[str] = set()
+        results = []
+        seen = set()
+        while len(results) < limit:
+            journeys = self.plan(origin_code, dest_code, max_transfers=max_transfers,
+                                 excluded_transfers=excluded, min_transfers=1, **kwargs)
+            if not journeys:
+                break
+            for journey in journeys:
+                key = tuple((leg.train_number, leg.to_code) for leg in journey.legs)
+                if key not in seen:
+                    seen.add(key)
+                    results.append(journey)
+                excluded.update(journey.transfer_stations)
+        return results[:limit]
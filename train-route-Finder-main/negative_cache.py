@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from train_stops_store import station_code
+
+logger = logging.getLogger(__name__)
+
+# Kinds of negative result
+EMPTY = 'empty'
+FAILED = 'failed'
+NO_TRAINS = 'no_trains'
+
+DEFAULT_EMPTY_TTL = int(os.environ.get('NEGATIVE_EMPTY_TTL', 1800))
+DEFAULT_FAILURE_TTL = int(os.environ.get('NEGATIVE_FAILURE_TTL', 300))
+# A pair found empty on this many different dates is assumed to have no trains at all
+DEFAULT_EMPTY_STRIKES = int(os.environ.get('NEGATIVE_EMPTY_STRIKES', 3))
+USE_BLOOM = os.environ.get('NEGATIVE_CACHE_BLOOM', '0') == '1'
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings, sized for `capacity` items at the
+    given false-positive rate. Items cannot be removed; clear() resets it.
+    """
+
+    def __init__(self, capacity: int = 20000, error_rate: float = 0.001):
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def clear(self):
+        self.bits = bytearray(len(self.bits))
+        self.count = 0
+
+class NegativeCache:
+    """
+    Remembers (from, to, date) searches that came back with no trains or
+    failed, so the next search does not load the page and sit through the
+    retries again. Empty results live for empty_ttl seconds and failures for
+    the shorter failure_ttl. With use_bloom, a station pair found empty on
+    empty_strikes different dates goes into a Bloom filter. After that it
+    counts as having no trains on any date, until clear() is called.
+    Stations are keyed by code.
+    """
+
+    def __init__(self, empty_ttl: int = DEFAULT_EMPTY_TTL, failure_ttl: int = DEFAULT_FAILURE_TTL,
+                 max_entries: int = 4096, use_bloom: bool = USE_BLOOM,
+                 empty_strikes: int = DEFAULT_EMPTY_STRIKES):
+        self.empty_ttl = empty_ttl
+        self.failure_ttl = failure_ttl
+        self.max_entries = max_entries
+        self.empty_strikes = empty_strikes
+        self.bloom = BloomFilter() if use_bloom else None
+        self.entries: "OrderedDict[Tuple[str, str, str], Tuple[float, str]]" = OrderedDict()
+        self.empty_dates: Dict[Tuple[str, str], set] = {}
+        self.lock = threading.Lock()
+        self.stats = {EMPTY: 0, FAILED: 0, NO_TRAINS: 0, 'recorded': 0}
+
+    @staticmethod
+    def _key(from_station: str, to_station: str, date: str) -> Tuple[str, str, str]:
+        return station_code(from_station), station_code(to_station), date
+
+    def check(self, from_station: str, to_station: str, date: str) -> Optional[str]:
+        """The kind of negative result stored for a search, or None if it should be scraped"""
+        key = self._key(from_station, to_station, date)
+        with self.lock:
+            if self.bloom is not None and f"{key[0]}-{key[1]}" in self.bloom:
+                self.stats[NO_TRAINS] += 1
+                kind = NO_TRAINS
+            else:
+                entry = self.entries.get(key)
+                if entry is None:
+                    return None
+                if entry[0] < time.monotonic():
+                    del self.entries[key]
+                    return None
+                kind = entry[1]
+                self.stats[kind] += 1
+        logger.info(f"✓ Negative cache hit ({kind}) for {from_station} -> {to_station} on {date}")
+        return kind
+
+    def _put(self, key: Tuple[str, str, str], kind: str, ttl: int):
+        self.entries[key] = (time.monotonic() + ttl, kind)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.stats['recorded'] += 1
+
+    def record_empty(self, from_station: str, to_station: str, date: str):
+        """Remember that a search found no trains"""
+        key = self._key(from_station, to_station, date)
+        with self.lock:
+            self._put(key, EMPTY, self.empty_ttl)
+            if self.bloom is None:
+                return
+            pair = key[:2]
+            dates = self.empty_dates.setdefault(pair, set())
+            dates.add(date)
+            if len(dates) >= self.empty_strikes:
+                self.bloom.add(f"{pair[0]}-{pair[1]}")
+                del self.empty_dates[pair]
+                logger.info(f"✗ No trains between {pair[0]} and {pair[1]} on {len(dates)} dates, skipping the pair")
+
+    def record_failure(self, from_station: str, to_station: str, date: str):
+        """Remember that a search failed after all its retries"""
+        with self.lock:
+            self._put(self._key(from_station, to_station, date), FAILED, self.failure_ttl)
+
+    def record_success(self, from_station: str, to_station: str, date: str):
+        """Forget negative results for a search that found trains"""
+        key = self._key(from_station, to_station, date)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.empty_dates.pop(key[:2], None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.empty_dates.clear()
+            if self.bloom is not None:
+                self.bloom.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get cache statistics"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+            stats['no_train_pairs'] = self.bloom.count if self.bloom is not None else 0
+        return stats
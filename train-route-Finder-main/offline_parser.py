@@ -0,0 +1,228 @@
+import logging
+import re
+import time
+from typing import Dict, List, Optional
+
+# Offline parsing needs lxml; the live scrapers work without it
+try:
+    from lxml import html as lxml_html
+    has_lxml = True
+except ImportError:
+    has_lxml = False
+
+logger = logging.getLogger(__name__)
+
+# Python ports of the in-browser scripts in train_availability_scraper and
+# train_route_scraper. They read archived page_source snapshots and return
+# the same dicts as extract_train_data and extract_train_routes.
+#
+# Text is read with innerText's line rules: whitespace collapses, block
+# elements start new lines, <p> leaves a blank line and <br> breaks a line.
+# A snapshot has no stylesheet, so whether an element is a block comes from
+# its tag, not from CSS. The output can therefore differ from the browser
+# when CSS changes an element's display (including hiding it) or applies
+# text-transform. Table cells are also not separated by tabs.
+
+# Elements the browser lays out as blocks by default
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'body', 'caption', 'dd', 'details', 'dialog', 'div',
+    'dl', 'dt', 'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5',
+    'h6', 'header', 'hgroup', 'hr', 'html', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section',
+    'summary', 'table', 'tbody', 'tfoot', 'thead', 'tr', 'ul'
+}
+# Elements whose content is never rendered
+SKIPPED_TAGS = {'head', 'noscript', 'script', 'style', 'template'}
+LINE_BREAK = '\n'
+
+def _has_class(name: str) -> str:
+    """XPath test for a class token, like the CSS selector .name"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+def _class_contains(name: str) -> str:
+    """XPath test for a class substring, like the CSS selector [class*='name']"""
+    return f"contains(@class, '{name}')"
+
+def _parse(page_source: str):
+    if not has_lxml:
+        raise RuntimeError("Offline parsing needs lxml (pip install lxml)")
+    return lxml_html.document_fromstring(page_source)
+
+def _collect(element, items: list):
+    """Flatten an element into text runs, <br> line breaks and block break counts"""
+    tag = element.tag.lower() if isinstance(element.tag, str) else None
+    if tag is None or tag in SKIPPED_TAGS:
+        return
+    if tag == 'br':
+        items.append(LINE_BREAK)
+        return
+    breaks = 2 if tag == 'p' else 1 if tag in BLOCK_TAGS else 0
+    if breaks:
+        items.append(breaks)
+    if element.text:
+        items.append(re.sub(r'\s+', ' ', element.text))
+    for child in element:
+        _collect(child, items)
+        if child.tail:
+            items.append(re.sub(r'\s+', ' ', child.tail))
+    if breaks:
+        items.append(breaks)
+
+def _text(element) -> str:
+    """innerText.trim() of an element, following the line rules described above"""
+    items = []
+    _collect(element, items)
+    out = []
+    pending = 0
+    has_content = False
+    for item in items:
+        if isinstance(item, int):
+            pending = max(pending, item)
+        elif item == LINE_BREAK:
+            out.append(LINE_BREAK)
+            pending = 0
+            has_content = True
+        elif item.strip():
+            if pending and has_content:
+                out.append(LINE_BREAK * pending)
+            out.append(item)
+            pending = 0
+            has_content = True
+        else:
+            out.append(item)
+    text = re.sub(r' +', ' ', ''.join(out))
+    return re.sub(r' *\n *', LINE_BREAK, text).strip()
+
+def _first_text(root, xpath: str) -> Optional[str]:
+    found = root.xpath(xpath)
+    return _text(found[0]) if found else None
+
+def _texts(root, xpath: str) -> List[str]:
+    return [_text(element) for element in root.xpath(xpath)]
+
+def _strip_parens(value: str) -> str:
+    return value.strip('()')
+
+def _cards(root):
+    return root.xpath(f"//*[{_has_class('Gwgxn')}]")
+
+def _name_number(card):
+    """(name, number) of a train card, or (None, None) if the card has neither"""
+    found = card.xpath(f".//*[{_has_class('k9j0o')}]")
+    if not found:
+        return None, None
+    name = _first_text(found[0], ".//h1")
+    number = _first_text(found[0], f".//*[{_has_class('qW4yv')}]")
+    return name, number
+
+def _price(container) -> Optional[str]:
+    found = container.xpath(f".//*[{_has_class('SHHaW')}]")
+    if not found:
+        return None
+    return _text(found[0]).split(LINE_BREAK)[0]
+
+def parse_train_data(page_source: str, target_train_number: Optional[str] = None) -> List[dict]:
+    """Trains with seat availability from a results page, as extract_train_data returns them"""
+    trains = []
+    for card in _cards(_parse(page_source)):
+        name, number = _name_number(card)
+        if name is None or number is None:
+            logger.error(f"Error extracting train name/number from card: {_text(card)[:60]!r}")
+            continue
+        train = {'name': name, 'number': _strip_parens(number)}
+        if target_train_number and train['number'] != target_train_number:
+            continue
+
+        times = _texts(card, f".//*[{_has_class('nnGXi')}]")
+        train['departure_time'] = times[0] if len(times) >= 2 else 'N/A'
+        train['arrival_time'] = times[1] if len(times) >= 2 else 'N/A'
+        duration = _first_text(card, f".//*[{_has_class('GVfQw')}]")
+        train['duration'] = duration if duration is not None else 'N/A'
+
+        containers = card.xpath(f".//*[{_has_class('PrZHl')}]")
+        classes = []
+        for i in range(0, len(containers), 2):
+            class_type = _first_text(containers[i], f".//*[{_has_class('bGfcC')}]")
+            availability = _first_text(containers[i], f".//*[{_has_class('envfU')}]")
+            if class_type is None or availability is None:
+                continue
+            price = _price(containers[i + 1]) if i + 1 < len(containers) else None
+            classes.append({'type': class_type, 'availability': availability,
+                            'price': 'N/A' if price is None else price})
+        train['classes_and_availability'] = classes
+        train['confirmation_chances'] = _texts(card, f".//*[{_has_class('Ob72l')}]")
+
+        stations = _texts(card, f".//*[{_has_class('pYpdU')}]")
+        train['from_station'] = stations[0] if len(stations) >= 2 else 'N/A'
+        train['to_station'] = stations[1] if len(stations) >= 2 else 'N/A'
+
+        trains.append(train)
+        if target_train_number:
+            break
+    return trains
+
+def parse_train_list(page_source: str) -> List[dict]:
+    """Every train card as {index, name, number}, like LIST_TRAINS_SCRIPT"""
+    trains = []
+    for index, card in enumerate(_cards(_parse(page_source))):
+        name, number = _name_number(card)
+        if name is not None and number is not None:
+            trains.append({'index': index, 'name': name, 'number': _strip_parens(number)})
+    return trains
+
+def parse_route_stops(page_source: str) -> List[dict]:
+    """Stops of the route modal open in a snapshot, like EXTRACT_STOPS_SCRIPT"""
+    stops = []
+    for row in _parse(page_source).xpath(f"//div[{_class_contains('aMT0H')}]"):
+        station = row.xpath(f".//div[{_class_contains('_kZZF')}]")
+        if not station:
+            continue
+        name = _first_text(station[0], f".//span[{_class_contains('_Hjc4')}]")
+        code = _first_text(station[0], f".//span[{_class_contains('LlBCs')}]")
+        if name is None or code is None:
+            continue
+        stop = {'station_name': name, 'station_code': _strip_parens(code)}
+        times = _texts(row, f".//div[{_class_contains('brNEO')}]")
+        if len(times) >= 3:
+            stop['arrival_time'] = times[0]
+            stop['halt_duration'] = times[1]
+            stop['departure_time'] = times[2]
+        row_text = _text(row)
+        if 'You are boarding here' in row_text:
+            stop['is_boarding_point'] = True
+        if 'You are droppping off here' in row_text:
+            stop['is_dropping_point'] = True
+        stops.append(stop)
+    return stops
+
+def parse_train_routes(page_source: str, route_pages: Dict[str, str],
+                       target_train_number: Optional[str] = None) -> List[dict]:
+    """
+    Trains with their stops, as extract_train_routes returns them. Stops come
+    from route_pages, the archived snapshots with each train's modal open;
+    trains without one are left out, like trains whose modal failed to open.
+    """
+    train_routes = []
+    for train in parse_train_list(page_source):
+        if target_train_number and train['number'] != target_train_number:
+            continue
+        route_page = route_pages.get(train['number'])
+        if route_page is None:
+            continue
+        train_routes.append({'name': train['name'], 'number': train['number'],
+                             'stops': parse_route_stops(route_page)})
+    return train_routes
+
+if __name__ == "__main__":
+    # Re-parse every archived page and report how long parsing takes
+    from page_archive import page_archive
+
+    logging.basicConfig(level=logging.INFO)
+    pages = page_archive.pages()
+    start = time.perf_counter()
+    trains = routes = 0
+    for from_code, to_code, date in pages:
+        page = page_archive.load(from_code, to_code, date)
+        trains += len(parse_train_data(page))
+        routes += len(parse_train_routes(page, page_archive.route_pages(from_code, to_code, date)))
+    elapsed = time.perf_counter() - start
+    print(f"Parsed {len(pages)} pages ({trains} trains, {routes} routes) in {elapsed:.2f}s")
@@ -0,0 +1,111 @@
+import glob
+import gzip
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+from train_stops_store import station_code
+
+logger = logging.getLogger(__name__)
+
+# Snapshots are only written when a directory is configured
+ARCHIVE_DIR = os.environ.get('PAGE_ARCHIVE_DIR', '')
+DEFAULT_ARCHIVE_DIR = 'page_archive'
+
+def page_key(from_station: str, to_station: str, date: str) -> str:
+    """Archive key for a results page; station names after the code are ignored"""
+    return f"{station_code(from_station)}-{station_code(to_station)}-{date}"
+
+class PageArchive:
+    """
+    Gzip-compressed snapshots of Paytm results pages, written by the
+    scrapers from driver.page_source. A page is stored as
+    <from>-<to>-<date>.html.gz; the same page with a train's route modal
+    open is stored next to it as <from>-<to>-<date>.route-<number>.html.gz.
+    The offline parser and ReplayBackend read them back.
+    """
+
+    def __init__(self, directory: str = DEFAULT_ARCHIVE_DIR, enabled: bool = True, compresslevel: int = 6):
+        self.directory = directory
+        self.enabled = enabled
+        self.compresslevel = compresslevel
+        self.lock = threading.Lock()
+        self.saved = 0
+        self.saved_bytes = 0
+
+    def _path(self, from_station: str, to_station: str, date: str, train_number: Optional[str] = None) -> str:
+        name = page_key(from_station, to_station, date)
+        if train_number:
+            name += f".route-{re.sub(r'[^0-9A-Za-z]', '', train_number)}"
+        return os.path.join(self.directory, f"{name}.html.gz")
+
+    def save(self, from_station: str, to_station: str, date: str, page_source: str,
+             train_number: Optional[str] = None) -> Optional[str]:
+        """Compress and store a page snapshot, replacing any older one"""
+        path = self._path(from_station, to_station, date, train_number)
+        data = gzip.compress(page_source.encode('utf-8'), self.compresslevel)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception as e:
+            logger.error(f"Error saving page snapshot {path}: {str(e)}")
+            return None
+        with self.lock:
+            self.saved += 1
+            self.saved_bytes += len(data)
+        logger.debug(f"✓ Saved page snapshot {path} ({len(data)} bytes)")
+        return path
+
+    def load(self, from_station: str, to_station: str, date: str,
+             train_number: Optional[str] = None) -> Optional[str]:
+        """The stored page, or None if it was never archived"""
+        path = self._path(from_station, to_station, date, train_number)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, 'rb') as f:
+                return f.read().decode('utf-8')
+        except Exception as e:
+            logger.error(f"Error reading page snapshot {path}: {str(e)}")
+            return None
+
+    def has(self, from_station: str, to_station: str, date: str, train_number: Optional[str] = None) -> bool:
+        return os.path.exists(self._path(from_station, to_station, date, train_number))
+
+    def route_pages(self, from_station: str, to_station: str, date: str) -> Dict[str, str]:
+        """Route modal snapshots of a results page, by train number"""
+        prefix = os.path.join(self.directory, f"{page_key(from_station, to_station, date)}.route-")
+        pages = {}
+        for path in glob.glob(glob.escape(prefix) + "*.html.gz"):
+            train_number = path[len(prefix):-len(".html.gz")]
+            page = self.load(from_station, to_station, date, train_number)
+            if page is not None:
+                pages[train_number] = page
+        return pages
+
+    def pages(self) -> List[Tuple[str, str, str]]:
+        """(from_code, to_code, date) of every archived results page"""
+        keys = []
+        for path in sorted(glob.glob(os.path.join(glob.escape(self.directory), "*.html.gz"))):
+            name = os.path.basename(path)[:-len(".html.gz")]
+            if ".route-" in name:
+                continue
+            parts = name.split('-')
+            if len(parts) == 3:
+                keys.append(tuple(parts))
+        return keys
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get archive statistics"""
+        return {
+            'enabled': self.enabled,
+            'saved': self.saved,
+            'saved_bytes': self.saved_bytes
+        }
+
+# Shared by both scrapers; set PAGE_ARCHIVE_DIR to start recording
+page_archive = PageArchive(ARCHIVE_DIR or DEFAULT_ARCHIVE_DIR, enabled=bool(ARCHIVE_DIR))
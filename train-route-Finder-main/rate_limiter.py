@@ -0,0 +1,235 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+from urllib.parse import urlparse
+from cancellation import CancelToken, SearchCancelled, pause
+
+logger = logging.getLogger(__name__)
+
+# Default policy for every host; tune with environment variables rather than sleeps
+DEFAULT_RATE = float(os.environ.get('SCRAPER_RATE', 1.0))
+DEFAULT_BURST = int(os.environ.get('SCRAPER_BURST', 4))
+DEFAULT_MIN_RATE = float(os.environ.get('SCRAPER_MIN_RATE', 0.05))
+DEFAULT_HOST_CONCURRENCY = int(os.environ.get('SCRAPER_HOST_CONCURRENCY', 4))
+DEFAULT_BACKOFF_BASE = float(os.environ.get('SCRAPER_BACKOFF_BASE', 5))
+DEFAULT_BACKOFF_MAX = float(os.environ.get('SCRAPER_BACKOFF_MAX', 300))
+DEFAULT_SLOW_SECONDS = float(os.environ.get('SCRAPER_SLOW_SECONDS', 20))
+
+def _host(url_or_host: str) -> str:
+    return urlparse(url_or_host).netloc if "://" in url_or_host else url_or_host
+
+def _wait(seconds: float, cancel_token: Optional[CancelToken]):
+    if not pause(seconds, cancel_token):
+        raise SearchCancelled(cancel_token.reason or "cancelled")
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> float:
+        """Take a token if one is available; otherwise return the seconds until one is"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, cancel_token: Optional[CancelToken] = None):
+        """Block until a token is taken, raising SearchCancelled if cancelled first"""
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            _wait(wait, cancel_token)
+
+    def set_rate(self, rate: float):
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+class HostGovernor:
+    """
+    Pacing policy for one host: a token bucket for the request rate, a cap
+    on requests in flight, and backoff. Errors and slow responses halve the
+    rate and block new requests for an exponentially growing window;
+    successful fast responses raise the rate again step by step, up to the
+    configured maximum.
+    """
+
+    def __init__(self, host: str, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+                 max_concurrency: int = DEFAULT_HOST_CONCURRENCY, min_rate: float = DEFAULT_MIN_RATE,
+                 backoff_base: float = DEFAULT_BACKOFF_BASE, backoff_max: float = DEFAULT_BACKOFF_MAX,
+                 slow_seconds: float = DEFAULT_SLOW_SECONDS):
+        self.host = host
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.slow_seconds = slow_seconds
+        self.in_flight = 0
+        self.failures = 0
+        self.blocked_until = 0.0
+        self.condition = threading.Condition()
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'errors': 0,
+            'slow': 0,
+            'backoffs': 0
+        }
+
+    def _wait_for_backoff(self, cancel_token: Optional[CancelToken]):
+        while True:
+            with self.condition:
+                remaining = self.blocked_until - time.monotonic()
+            if remaining <= 0:
+                return
+            _wait(remaining, cancel_token)
+
+    def throttle(self, cancel_token: Optional[CancelToken] = None):
+        """Wait out any backoff and take a token, for requests made within a permit"""
+        self._wait_for_backoff(cancel_token)
+        if self.bucket.try_acquire() > 0:
+            with self.condition:
+                self.stats['throttled'] += 1
+            self.bucket.acquire(cancel_token)
+
+    @contextmanager
+    def permit(self, cancel_token: Optional[CancelToken] = None, count_errors: bool = True):
+        """
+        Hold one of the host's concurrency slots for the duration of a with
+        block, after waiting for backoff and a token. Exceptions escaping
+        the block count as errors, unless the search was cancelled or
+        count_errors is False (the caller cut its own timeout short); blocks
+        slower than slow_seconds count as slow responses.
+        """
+        with self.condition:
+            while self.in_flight >= self.max_concurrency:
+                if cancel_token and cancel_token.is_cancelled():
+                    raise SearchCancelled(cancel_token.reason or "cancelled")
+                self.condition.wait(0.5)
+            self.in_flight += 1
+        try:
+            self.throttle(cancel_token)
+            with self.condition:
+                self.stats['requests'] += 1
+            started = time.monotonic()
+            try:
+                yield self
+            except SearchCancelled:
+                raise
+            except Exception:
+                # A timeout the search imposed on itself says nothing about the host
+                if count_errors and not (cancel_token and cancel_token.is_cancelled()):
+                    self.record_error()
+                raise
+            elapsed = time.monotonic() - started
+            if elapsed > self.slow_seconds:
+                self.record_slow(elapsed)
+            else:
+                self.record_success()
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify()
+
+    def _back_off(self, reason: str):
+        with self.condition:
+            self.failures += 1
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (self.failures - 1))
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            rate = max(self.min_rate, self.bucket.rate / 2)
+            self.stats['backoffs'] += 1
+        self.bucket.set_rate(rate)
+        logger.warning(f"✗ {self.host}: {reason}, backing off {delay:.1f}s at {rate:.2f} req/s")
+
+    def record_error(self):
+        with self.condition:
+            self.stats['errors'] += 1
+        self._back_off("request failed")
+
+    def record_slow(self, elapsed: float):
+        with self.condition:
+            self.stats['slow'] += 1
+        self._back_off(f"slow response ({elapsed:.0f}s)")
+
+    def record_success(self):
+        with self.condition:
+            self.failures = 0
+            rate = self.bucket.rate
+        if rate < self.max_rate:
+            # Additive increase: a tenth of the maximum rate per success
+            self.bucket.set_rate(min(self.max_rate, rate + self.max_rate / 10))
+
+    def get_stats(self) -> Dict[str, float]:
+        """Get governor metrics"""
+        with self.condition:
+            stats = dict(self.stats)
+            stats.update({
+                'rate': round(self.bucket.rate, 3),
+                'in_flight': self.in_flight,
+                'backoff_remaining': round(max(0.0, self.blocked_until - time.monotonic()), 1)
+            })
+        return stats
+
+class RateLimiter:
+    """
+    Central pacing layer for every scraper request. Governors are created
+    per host on first use with the default policy, or configured up front
+    with configure().
+    """
+
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self.governors: Dict[str, HostGovernor] = {}
+        self.lock = threading.Lock()
+
+    def configure(self, host: str, **policy) -> HostGovernor:
+        """Replace the policy for a host"""
+        governor = HostGovernor(_host(host), **{**self.defaults, **policy})
+        with self.lock:
+            self.governors[governor.host] = governor
+        return governor
+
+    def governor(self, url_or_host: str) -> HostGovernor:
+        host = _host(url_or_host)
+        with self.lock:
+            governor = self.governors.get(host)
+            if governor is None:
+                governor = HostGovernor(host, **self.defaults)
+                self.governors[host] = governor
+            return governor
+
+    def permit(self, url: str, cancel_token: Optional[CancelToken] = None, count_errors: bool = True):
+        """Context manager holding a request slot for the host of url"""
+        return self.governor(url).permit(cancel_token, count_errors)
+
+    def throttle(self, url_or_host: str, cancel_token: Optional[CancelToken] = None):
+        """Take a token for a follow-up request to a host"""
+        self.governor(url_or_host).throttle(cancel_token)
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Get metrics for every host seen so far"""
+        with self.lock:
+            governors = list(self.governors.values())
+        return {governor.host: governor.get_stats() for governor in governors}
+
+# Shared by both scrapers
+rate_limiter = RateLimiter()
@@ -1,19 +1,28 @@
 #6
-from typing import List, Dict, Set, Tuple, Optional
+from typing import Callable, Iterator, List, Dict, Set, Tuple, Optional
 import logging
 from datetime import datetime, timedelta
 import re
+import bisect
 import threading
 from queue import Queue
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
 import time
-from train_stops_store import TrainStopsStore
+from train_stops_store import MINUTES_PER_DAY, NO_TIME, TrainTimetable, build_timetable, shared_store, station_code
+from timetable_index import TimetableIndex
+from journey_planner import JourneyPlanner, Journey
+from scrape_memo import BoundScrapeMemo, ScrapeBudget, ScrapeMemo
+from cancellation import CancelToken, bind_cancel_token
+from route_ranking import RouteRanker
+from worker_pool import scrape_pool
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize the cache at the module level
-stops_store = TrainStopsStore()
+stops_store = shared_store()
+timetable_index = TimetableIndex(stops_store)
+journey_planner = JourneyPlanner(stops_store)
 
 def parse_train_time(time_str: str, date_str: str) -> Optional[datetime]:
     """
@@ -177,10 +186,167 @@ def is_valid_connection(arrival_time: datetime, departure_time: datetime, min_co
     minutes_difference = time_difference.total_seconds() / 60
     return minutes_difference >= min_connection_time
 
+def parse_available_legs(trains: Optional[List[Dict]], date_str: str) -> List[Dict]:
+    """Parse scraped trains once, keeping those with seats and known times"""
+    legs = []
+    for train in trains or []:
+        details = parse_train_details(train, date_str)
+        if details and details['has_seats'] and details['departure_time'] and details['arrival_time']:
+            legs.append(details)
+    return legs
+
+def match_connections(first_legs: List[Dict], second_legs: List[Dict],
+                      min_connection_time: int = 30) -> List[Tuple[Dict, Dict]]:
+    """
+    All valid (first leg, second leg) connections, found with a binary-search
+    join over second legs sorted by departure instead of comparing every pair.
+    Connections are ordered by final arrival, then by shorter wait.
+    """
+    second_sorted = sorted(second_legs, key=lambda details: details['departure_time'])
+    departures = [details['departure_time'] for details in second_sorted]
+    gap = timedelta(minutes=min_connection_time)
+    
+    connections = []
+    for first in first_legs:
+        start = bisect.bisect_left(departures, first['arrival_time'] + gap)
+        for second in second_sorted[start:]:
+            connections.append((first, second))
+    
+    connections.sort(key=lambda pair: (pair[1]['arrival_time'], pair[1]['departure_time'] - pair[0]['arrival_time']))
+    return connections
+
+def claim_connection(connections: List[Tuple[Dict, Dict]], intermediate: str,
+                     found_routes: set, found_routes_lock: threading.Lock) -> Optional[Tuple[Dict, Dict]]:
+    """Claim the best connection not already found by another worker, taking the lock once"""
+    keyed = [
+        ((first['train_number'], intermediate, second['train_number']), first, second)
+        for first, second in connections
+    ]
+    with found_routes_lock:
+        for route_key, first, second in keyed:
+            if route_key not in found_routes:
+                found_routes.add(route_key)
+                return first, second
+    return None
+
+def record_successful_route(origin: str, destination: str, intermediate: str):
+    """Save a successful intermediate for the ML predictor"""
+    thread_name = threading.current_thread().name
+    
+    # Extract pure station codes for ML model
+    origin_code = station_code(origin)
+    dest_code = station_code(destination)
+    intermediate_code = station_code(intermediate)
+    
+    # Update ML model synchronously to ensure it's saved
+    try:
+        from train_route_learner import FastTrainRoutePredictor
+        predictor = FastTrainRoutePredictor('train_stops.json', 'station_names.json', stops_store=stops_store)
+        
+        # Update the route with just the codes
+        predictor.station_stats[intermediate_code]['success_count'] += 1
+        predictor.station_stats[intermediate_code]['route_successes'][(origin_code, dest_code)] += 1
+        
+        # Save to the JSON file directly (not async)
+        predictor.save_successful_routes('successful_routes.json')
+        logger.info(f"Thread {thread_name}: Saved successful route via {intermediate_code}")
+    except Exception as e:
+        logger.error(f"Thread {thread_name}: Error saving route: {str(e)}")
+
+def build_segment(details: Dict, from_station: str, to_station: str) -> Dict:
+    """Route segment from parsed train details"""
+    return {
+        'train_number': details['train_number'],
+        'from_station': from_station,
+        'to_station': to_station,
+        'departure_time': details['departure_time'],
+        'arrival_time': details['arrival_time'],
+        'departure_date': details['departure_date'],
+        'arrival_date': details['arrival_date']
+    }
+
+def build_two_leg_route(origin: str, intermediate: str, destination: str,
+                        first_leg_details: Dict, second_leg_details: Dict) -> Dict:
+    """Route with one transfer at intermediate"""
+    return {
+        'segments': [
+            build_segment(first_leg_details, origin, intermediate),
+            build_segment(second_leg_details, intermediate, destination)
+        ]
+    }
+
+def candidate_stops(stops: List[Dict], origin_code: str, dest_code: str,
+                    timetable: Optional[TrainTimetable] = None) -> List[Dict]:
+    """
+    Stops that can serve as a transfer between origin and destination:
+    strictly after the boarding point and before the destination on this
+    train, ordered by timetable arrival. Stops before boarding or past the
+    destination can never give a valid connection.
+    """
+    if timetable is None:
+        timetable = build_timetable(stops)
+    codes = list(timetable.station_codes)
+    
+    if origin_code in codes:
+        start = codes.index(origin_code)
+    else:
+        start = next((i for i, stop in enumerate(stops) if stop.get('is_boarding_point')), -1)
+    
+    if dest_code in codes[start + 1:]:
+        end = codes.index(dest_code, start + 1)
+    else:
+        end = next((i for i, stop in enumerate(stops) if i > start and stop.get('is_dropping_point')), len(stops))
+    
+    arrivals = timetable.arrival_minutes
+    between = [
+        (arrivals[i] if arrivals[i] != NO_TIME else float('inf'), i)
+        for i in range(start + 1, end)
+    ]
+    between.sort()
+    return [stops[i] for _, i in between]
+
+def timetable_arrival_times(timetable: TrainTimetable, origin_code: str, date: str) -> Dict[str, datetime]:
+    """
+    Arrival datetime at each stop after boarding at origin on date, read from
+    the pre-parsed minute offsets so overnight legs land on the right day.
+    """
+    if timetable.start_minute == NO_TIME:
+        return {}
+    board = max(timetable.position(origin_code), 0)
+    board_minute = timetable.departure_minutes[board]
+    if board_minute == NO_TIME:
+        board_minute = 0
+    base = datetime.strptime(date, "%Y%m%d") + timedelta(
+        minutes=(timetable.start_minute + board_minute) % MINUTES_PER_DAY - board_minute
+    )
+    return {
+        code: base + timedelta(minutes=timetable.arrival_minutes[i])
+        for i, code in enumerate(timetable.station_codes)
+        if i > board and timetable.arrival_minutes[i] != NO_TIME
+    }
+
+def route_lower_bound(station_codes: List[str], ranker: RouteRanker) -> Optional[float]:
+    """
+    Lowest cost any route through these stations could have: the shortest
+    stored in-train time for each leg plus the transfer penalties. None when
+    a leg is not covered by the timetable, so the candidate is never pruned.
+    """
+    total = ranker.transfer_penalty * (len(station_codes) - 2)
+    for from_code, to_code in zip(station_codes, station_codes[1:]):
+        minutes = timetable_index.min_travel_minutes(from_code, to_code)
+        if minutes is None:
+            return None
+        total += minutes
+    return total
+
 def process_single_route(origin: str, destination: str, date: str, train: Dict, 
                         scrape_routes, scrape_availability, result_queue: Queue, stop_event: threading.Event,
-                        found_routes: set, found_routes_lock: threading.Lock):
-    """Process a single train route in a separate thread"""
+                        found_routes: set, found_routes_lock: threading.Lock, min_connection_time: int = 30,
+                        ranker: Optional[RouteRanker] = None, meeting_codes: Optional[Set[str]] = None):
+    """
+    Process a single train route in a separate thread. With meeting_codes
+    (bidirectional search) only stops that also reach the destination are tried.
+    """
     train_number = train.get('number', 'Unknown')
     thread_name = threading.current_thread().name
     
@@ -196,13 +362,16 @@ def process_single_route(origin: str, destination: str, date: str, train: Dict,
         else:
             logger.info(f"Thread {thread_name}: Fetching route data for train {train_number}")
             route_data = scrape_routes(origin, destination, date, target_train_number=train_number)
-            if route_data and route_data[0].get('stops'):
+            # The Selenium scraper stores what it harvests; other backends do not
+            if route_data and route_data[0].get('stops') and not stops_store.has_stops(train_number):
                 stops_store.add_stops(train_number, route_data[0]['stops'])
                 
         if not route_data:
             return
             
         processed_stations = set()
+        origin_code = station_code(origin)
+        dest_code = station_code(destination)
         
         for train_route in route_data:
             if stop_event.is_set():
@@ -211,9 +380,15 @@ def process_single_route(origin: str, destination: str, date: str, train: Dict,
             if 'stops' not in train_route:
                 continue
                 
-            logger.info(f"Thread {thread_name}: Processing {len(train_route['stops'])} stops")
+            timetable = stops_store.get_timetable(train_route.get('number', train_number)) or build_timetable(train_route['stops'])
+            arrival_times = timetable_arrival_times(timetable, origin_code, date)
+            stops = candidate_stops(train_route['stops'], origin_code, dest_code, timetable)
+            if meeting_codes:
+                stops = [stop for stop in stops if stop.get('station_code') in meeting_codes]
+            logger.info(f"Thread {thread_name}: Processing {len(stops)} of {len(train_route['stops'])} stops "
+                        f"between {origin_code} and {dest_code}")
             
-            for stop in train_route['stops']:
+            for stop in stops:
                 if stop_event.is_set():
                     return
                     
@@ -228,35 +403,29 @@ def process_single_route(origin: str, destination: str, date: str, train: Dict,
                     
                 processed_stations.add(intermediate)
                 
-                arrival_time = parse_train_time(stop['arrival_time'], date)
+                if ranker is not None and not ranker.can_improve(
+                        route_lower_bound([origin_code, stop.get('station_code'), dest_code], ranker)):
+                    continue
+                
+                arrival_time = arrival_times.get(stop.get('station_code'))
                 if not arrival_time:
                     continue
                 
-                connection_date = date
+                connection_date = arrival_time.strftime("%Y%m%d")
                 if arrival_time.hour >= 23 and arrival_time.minute >= 30:
-                    connection_date = get_next_day_date(date)
+                    connection_date = get_next_day_date(connection_date)
                 
                 # Quick check for available seats to destination
                 logger.info(f"Thread {thread_name}: Checking seat availability from {intermediate} to {destination}")
                 second_leg_trains = scrape_availability(intermediate, destination, connection_date)
                 
-                available_second_legs = []
-                # Check same day
-                if second_leg_trains:
-                    for train in second_leg_trains:
-                        details = parse_train_details(train, connection_date)
-                        if details and details['has_seats']:
-                            available_second_legs.append((train, connection_date))
-                
-                # Check next day if needed
-                if not available_second_legs:
+                # Parse each leg once; check the next day only if nobody has seats that day
+                available_second_legs = parse_available_legs(second_leg_trains, connection_date)
+                if not available_second_legs and not stop_event.is_set():
                     next_day = get_next_day_date(connection_date)
-                    second_leg_trains = scrape_availability(intermediate, destination, next_day)
-                    if second_leg_trains:
-                        for train in second_leg_trains:
-                            details = parse_train_details(train, next_day)
-                            if details and details['has_seats']:
-                                available_second_legs.append((train, next_day))
+                    available_second_legs = parse_available_legs(
+                        scrape_availability(intermediate, destination, next_day), next_day
+                    )
                 
                 if not available_second_legs:
                     logger.info(f"Thread {thread_name}: No seats available from {intermediate} to {destination}, skipping station")
@@ -264,152 +433,274 @@ def process_single_route(origin: str, destination: str, date: str, train: Dict,
                 
                 # If we have available seats, check first leg trains
                 logger.info(f"Thread {thread_name}: Found {len(available_second_legs)} trains with seats from {intermediate}")
-                first_leg_trains = scrape_availability(origin, intermediate, date)
+                if stop_event.is_set():
+                    return
+                first_legs = parse_available_legs(scrape_availability(origin, intermediate, date), date)
                 
-                for first_leg in first_leg_trains:
-                    if stop_event.is_set():
-                        return
-                        
-                    first_leg_details = parse_train_details(first_leg, date)
-                    if not first_leg_details or not first_leg_details['has_seats']:
-                        continue
-                    
-                    # Check each available second leg
-                    for second_leg, second_leg_date in available_second_legs:
-                        if stop_event.is_set():
-                            return
-                            
-                        second_leg_details = parse_train_details(second_leg, second_leg_date)
-                        
-                        # Create unique route identifier
-                        route_key = (
-                            first_leg_details['train_number'],
-                            intermediate,
-                            second_leg_details['train_number']
-                        )
-                        
-                        with found_routes_lock:
-                            if route_key in found_routes:
-                                continue
-                                
-                            if is_valid_connection(
-                                first_leg_details['arrival_time'],
-                                second_leg_details['departure_time']
-                            ):
-                                found_routes.add(route_key)
-                                logger.info(f"Thread {thread_name}: Found valid route via {intermediate}")
-                                
-                                # Extract pure station codes for ML model
-                                origin_code = origin.split('_')[0] if '_' in origin else origin
-                                dest_code = destination.split('_')[0] if '_' in destination else destination
-                                intermediate_code = intermediate.split('_')[0] if '_' in intermediate else intermediate
-                                
-                                # Update ML model synchronously to ensure it's saved
-                                try:
-                                    from train_route_learner import FastTrainRoutePredictor
-                                    predictor = FastTrainRoutePredictor('train_stops.json', 'station_names.json')
-                                    
-                                    # Update the route with just the codes
-                                    predictor.station_stats[intermediate_code]['success_count'] += 1
-                                    predictor.station_stats[intermediate_code]['route_successes'][(origin_code, dest_code)] += 1
-                                    
-                                    # Save to the JSON file directly (not async)
-                                    predictor.save_successful_routes('successful_routes.json')
-                                    logger.info(f"Thread {thread_name}: Saved successful route via {intermediate_code}")
-                                except Exception as e:
-                                    logger.error(f"Thread {thread_name}: Error saving route: {str(e)}")
-                                
-                                route = {
-                                    'segments': [
-                                        {
-                                            'train_number': first_leg_details['train_number'],
-                                            'from_station': origin,
-                                            'to_station': intermediate,
-                                            'departure_time': first_leg_details['departure_time'],
-                                            'arrival_time': first_leg_details['arrival_time'],
-                                            'departure_date': first_leg_details['departure_date'],
-                                            'arrival_date': first_leg_details['arrival_date']
-                                        },
-                                        {
-                                            'train_number': second_leg_details['train_number'],
-                                            'from_station': intermediate,
-                                            'to_station': destination,
-                                            'departure_time': second_leg_details['departure_time'],
-                                            'arrival_time': second_leg_details['arrival_time'],
-                                            'departure_date': second_leg_details['departure_date'],
-                                            'arrival_date': second_leg_details['arrival_date']
-                                        }
-                                    ]
-                                }
-                                result_queue.put(route)
-                                return  # Exit after finding a valid route
+                connections = match_connections(first_legs, available_second_legs, min_connection_time)
+                claimed = claim_connection(connections, intermediate, found_routes, found_routes_lock)
+                if claimed and not stop_event.is_set():
+                    first_leg_details, second_leg_details = claimed
+                    logger.info(f"Thread {thread_name}: Found valid route via {intermediate}")
+                    record_successful_route(origin, destination, intermediate)
+                    result_queue.put(build_two_leg_route(origin, intermediate, destination,
+                                                         first_leg_details, second_leg_details))
+                    return  # Exit after finding a valid route
 
     except Exception as e:
         logger.error(f"Thread {thread_name}: Error processing train {train_number}: {str(e)}")
         logger.debug(f"Thread {thread_name}: Full error details:", exc_info=True)
 
-def find_routes(origin: str, destination: str, date: str, scrape_availability, scrape_routes, max_routes: int = 1):
+def process_planned_journey(journey: Journey, origin: str, destination: str, date: str,
+                            scrape_availability, result_queue: Queue, stop_event: threading.Event,
+                            found_routes: set, found_routes_lock: threading.Lock, min_connection_time: int = 30,
+                            ranker: Optional[RouteRanker] = None):
+    """
+    Check seat availability on each leg of a journey proposed by the planner.
+    The planned train is preferred on every leg; any other train with seats
+    that keeps the connections valid is accepted in its place.
+    """
+    thread_name = threading.current_thread().name
+    base_date = datetime.strptime(date, "%Y%m%d")
+    
+    try:
+        if ranker is not None and not ranker.can_improve(route_lower_bound(
+                [journey.legs[0].from_code] + [leg.to_code for leg in journey.legs], ranker)):
+            logger.info(f"Thread {thread_name}: Skipping journey via {', '.join(journey.transfer_stations)}, "
+                        f"it cannot beat the current top routes")
+            return
+        
+        segments = []
+        previous_arrival = None
+        
+        for idx, leg in enumerate(journey.legs):
+            if stop_event.is_set():
+                return
+            
+            is_last_leg = idx == len(journey.legs) - 1
+            from_station = origin if idx == 0 else timetable_index.station_with_name(leg.from_code)
+            to_station = destination if is_last_leg else timetable_index.station_with_name(leg.to_code)
+            leg_date = (base_date + timedelta(days=leg.departure_minute // MINUTES_PER_DAY)).strftime("%Y%m%d")
+            
+            logger.info(f"Thread {thread_name}: Checking planned train {leg.train_number} from {from_station} to {to_station} on {leg_date}")
+            leg_trains = scrape_availability(from_station, to_station, leg_date) or []
+            
+            candidates = []
+            for train in leg_trains:
+                details = parse_train_details(train, leg_date)
+                if not details or not details['has_seats']:
+                    continue
+                if previous_arrival and not is_valid_connection(previous_arrival, details['departure_time'],
+                                                                min_connection_time):
+                    continue
+                if details['train_number'] == leg.train_number:
+                    candidates.insert(0, details)
+                elif is_last_leg or (details['arrival_time'] and
+                                     details['arrival_time'] <= leg.arrival_datetime(date)):
+                    candidates.append(details)
+            
+            if not candidates:
+                logger.info(f"Thread {thread_name}: No seats on planned leg {from_station} -> {to_station}, dropping journey")
+                return
+            
+            details = candidates[0]
+            previous_arrival = details['arrival_time']
+            segments.append(build_segment(details, from_station, to_station))
+        
+        route_key = tuple((segment['train_number'], segment['to_station']) for segment in segments)
+        with found_routes_lock:
+            if route_key in found_routes:
+                return
+            found_routes.add(route_key)
+        
+        logger.info(f"Thread {thread_name}: Planned journey confirmed via {', '.join(journey.transfer_stations)}")
+        result_queue.put({'segments': segments})
+        
+    except Exception as e:
+        logger.error(f"Thread {thread_name}: Error checking planned journey: {str(e)}")
+        logger.debug(f"Thread {thread_name}: Full error details:", exc_info=True)
+
+def extend_paths(paths: List[List[Dict]], legs: List[Dict], min_connection_time: int = 30,
+                 max_paths: int = 5) -> List[List[Dict]]:
+    """
+    Extend partial itineraries with the next leg: every valid connection
+    from a path's last train, keeping the best path per new train and at
+    most max_paths paths, earliest arrival first.
+    """
+    path_for = {id(path[-1]): path for path in paths}
+    extended = []
+    seen_trains = set()
+    for last, details in match_connections([path[-1] for path in paths], legs, min_connection_time):
+        if details['train_number'] in seen_trains:
+            continue
+        seen_trains.add(details['train_number'])
+        extended.append(path_for[id(last)] + [details])
+        if len(extended) >= max_paths:
+            break
+    return extended
+
+def process_transfer_pair(first_transfer: str, second_transfer: str, origin: str, destination: str, date: str,
+                          scrape_availability, result_queue: Queue, stop_event: threading.Event,
+                          found_routes: set, found_routes_lock: threading.Lock, min_connection_time: int = 30,
+                          ranker: Optional[RouteRanker] = None):
+    """
+    Check a three-leg route origin -> first_transfer -> second_transfer ->
+    destination, scraping one leg at a time and giving up at the first leg
+    with no connecting train that has seats.
+    """
+    thread_name = threading.current_thread().name
+    stations = [origin, first_transfer, second_transfer, destination]
+    
+    try:
+        if ranker is not None and not ranker.can_improve(
+                route_lower_bound([station_code(station) for station in stations], ranker)):
+            logger.info(f"Thread {thread_name}: Skipping {first_transfer} + {second_transfer}, "
+                        f"it cannot beat the current top routes")
+            return
+        
+        paths = [[details] for details in
+                 parse_available_legs(scrape_availability(origin, first_transfer, date), date)]
+        for from_station, to_station in zip(stations[1:], stations[2:]):
+            if not paths or stop_event.is_set():
+                logger.info(f"Thread {thread_name}: No seats into {from_station}, dropping pair")
+                return
+            
+            # Scrape the leg on each day the current paths arrive
+            legs = []
+            for leg_date in sorted({path[-1]['arrival_date'] for path in paths}):
+                legs.extend(parse_available_legs(scrape_availability(from_station, to_station, leg_date), leg_date))
+            paths = extend_paths(paths, legs, min_connection_time)
+        
+        if not paths:
+            logger.info(f"Thread {thread_name}: No seats into {destination} via {first_transfer} + {second_transfer}")
+            return
+        
+        path = paths[0]
+        route_key = tuple((details['train_number'], station) for details, station in zip(path, stations[1:]))
+        with found_routes_lock:
+            if route_key in found_routes:
+                return
+            found_routes.add(route_key)
+        
+        logger.info(f"Thread {thread_name}: Found two-transfer route via {first_transfer} and {second_transfer}")
+        result_queue.put({
+            'segments': [
+                build_segment(details, from_station, to_station)
+                for details, from_station, to_station in zip(path, stations, stations[1:])
+            ]
+        })
+        
+    except Exception as e:
+        logger.error(f"Thread {thread_name}: Error checking {first_transfer} + {second_transfer}: {str(e)}")
+        logger.debug(f"Thread {thread_name}: Full error details:", exc_info=True)
+
+def find_routes(origin: str, destination: str, date: str, scrape_availability, scrape_routes, max_routes: int = 1,
+                max_timetable_stations: int = 8, max_planned_journeys: int = 5, max_transfers: int = 1,
+                min_connection_time: int = 30,
+                on_route: Optional[Callable[[Dict], None]] = None,
+                cancel_token: Optional[CancelToken] = None, timeout: Optional[float] = None,
+                planned_journeys: Optional[List[Journey]] = None,
+                preferred_intermediates: Optional[List[str]] = None,
+                ranking: Optional[str] = None, search_budget: Optional[float] = None,
+                max_transfer_pairs: int = 4, max_transfer_pair_scrapes: int = 12,
+                bidirectional: bool = False):
     """
     Find routes between stations with valid connections and seat availability.
-    Uses parallel processing for faster results
+    Uses parallel processing for faster results. Tries planner journeys,
+    timetable intermediates, ML predictions, then the scraping fan-out.
+    
+    on_route: called with each route as soon as it is accepted
+    cancel_token, timeout: stop the search and its page loads; routes found so far are returned
+    planned_journeys, preferred_intermediates: reuse work from related searches (see find_routes_window)
+    ranking: None returns the first max_routes found; 'best' the lowest-cost ones, 'pareto' the Pareto front
+    search_budget: seconds a ranked search may spend
+    max_transfer_pairs, max_transfer_pair_scrapes: bound the two-transfer step
+    bidirectional: only try transfers reachable from both origin and destination
     """
+    if ranking not in (None, 'best', 'pareto'):
+        raise ValueError(f"Unknown ranking mode: {ranking}")
     logger.info(f"Finding up to {max_routes} routes from {origin} to {destination} on {date}")
     
+    # Per-search token: cancelled when this search ends, or when the caller's token is
+    if ranking and search_budget is not None:
+        timeout = search_budget if timeout is None else min(timeout, search_budget)
+    stop_event = CancelToken(timeout=timeout, parent=cancel_token)
+    scrape_routes = bind_cancel_token(scrape_routes, stop_event)
+    # A memo shared with other searches still loads and waits under this search's token
+    if not isinstance(scrape_availability, (ScrapeMemo, BoundScrapeMemo)):
+        scrape_availability = ScrapeMemo(scrape_availability)
+    scrape_availability = scrape_availability.bind(stop_event)
+    
+    ranker = RouteRanker(max_routes) if ranking else None
     all_routes = []
     result_queue = Queue()
-    stop_event = threading.Event()
     found_routes = set()
     found_routes_lock = threading.Lock()
     executor = None
     futures = []
     
+    def enough():
+        """Unranked searches stop at max_routes; ranked ones run until the budget is spent"""
+        return ranker is None and len(all_routes) >= max_routes
+    
+    def final_routes():
+        if ranker is None:
+            return all_routes[:max_routes]
+        return ranker.pareto_front() if ranking == 'pareto' else ranker.best()
+    
+    def add_route(route):
+        """Accept a route and report it to the on_route callback"""
+        all_routes.append(route)
+        if ranker is not None:
+            ranker.offer(route)
+        if on_route:
+            try:
+                on_route(route)
+            except Exception as e:
+                logger.error(f"Error in on_route callback: {str(e)}")
+    
     def quick_shutdown():
         """Immediately shutdown everything"""
+        if not stop_event.is_set():
+            logger.info(f"Availability memo stats: {scrape_availability.get_stats()}")
+            if ranker is not None:
+                logger.info(f"Route ranking stats: {ranker.get_stats()}")
         stop_event.set()
         if executor:
-            executor._threads.clear()
             for f in futures:
                 f.cancel()
             executor.shutdown(wait=False, cancel_futures=True)
-        return all_routes[:max_routes]  # Return immediately with found routes
+        return final_routes()  # Return immediately with found routes
     
-    def process_ml_station(intermediate, origin, destination, date, 
+    def process_intermediate_station(intermediate, origin, destination, date, 
                       scrape_routes, scrape_availability, result_queue, stop_event,
                       found_routes, found_routes_lock):
-        """Process a single ML-predicted intermediate station using similar logic to process_single_route"""
+        """Process a single candidate intermediate station using similar logic to process_single_route"""
         thread_name = threading.current_thread().name
         
         try:
             if stop_event.is_set():
                 return
                 
-            logger.info(f"Thread {thread_name}: Checking ML-predicted station: {intermediate}")
+            if ranker is not None and not ranker.can_improve(
+                    route_lower_bound([station_code(origin), station_code(intermediate), station_code(destination)],
+                                      ranker)):
+                logger.info(f"Thread {thread_name}: Skipping {intermediate}, it cannot beat the current top {max_routes}")
+                return
+            
+            logger.info(f"Thread {thread_name}: Checking candidate station: {intermediate}")
             
             # Quick check for available seats from intermediate to destination
             logger.info(f"Thread {thread_name}: Checking seat availability from {intermediate} to {destination}")
             second_leg_trains = scrape_availability(intermediate, destination, date)
             
-            available_second_legs = []
-            # Check same day
-            if second_leg_trains:
-                for train in second_leg_trains:
-                    if stop_event.is_set():
-                        return
-                    details = parse_train_details(train, date)
-                    if details and details['has_seats']:
-                        available_second_legs.append((train, date))
-            
-            # Check next day if needed
-            if not available_second_legs:
+            # Parse each leg once; check the next day only if nobody has seats today
+            available_second_legs = parse_available_legs(second_leg_trains, date)
+            if not available_second_legs and not stop_event.is_set():
                 next_day = get_next_day_date(date)
-                second_leg_trains = scrape_availability(intermediate, destination, next_day)
-                if second_leg_trains:
-                    for train in second_leg_trains:
-                        if stop_event.is_set():
-                            return
-                        details = parse_train_details(train, next_day)
-                        if details and details['has_seats']:
-                            available_second_legs.append((train, next_day))
+                available_second_legs = parse_available_legs(
+                    scrape_availability(intermediate, destination, next_day), next_day
+                )
             
             if not available_second_legs:
                 logger.info(f"Thread {thread_name}: No seats available from {intermediate} to {destination}, skipping station")
@@ -417,88 +708,21 @@ def find_routes(origin: str, destination: str, date: str, scrape_availability, s
             
             # If we have available seats for second leg, check first leg trains
             logger.info(f"Thread {thread_name}: Found {len(available_second_legs)} trains with seats from {intermediate}")
-            first_leg_trains = scrape_availability(origin, intermediate, date)
+            if stop_event.is_set():
+                return
+            first_legs = parse_available_legs(scrape_availability(origin, intermediate, date), date)
             
-            for first_leg in first_leg_trains:
-                if stop_event.is_set():
-                    return
-                    
-                first_leg_details = parse_train_details(first_leg, date)
-                if not first_leg_details or not first_leg_details['has_seats']:
-                    continue
-                
-                # Check each available second leg
-                for second_leg, second_leg_date in available_second_legs:
-                    if stop_event.is_set():
-                        return
-                        
-                    second_leg_details = parse_train_details(second_leg, second_leg_date)
-                    
-                    # Create unique route identifier
-                    route_key = (
-                        first_leg_details['train_number'],
-                        intermediate,
-                        second_leg_details['train_number']
-                    )
-                    
-                    with found_routes_lock:
-                        if route_key in found_routes:
-                            continue
-                            
-                        if is_valid_connection(
-                            first_leg_details['arrival_time'],
-                            second_leg_details['departure_time']
-                        ):
-                            found_routes.add(route_key)
-                            logger.info(f"Thread {thread_name}: Found valid ML route via {intermediate}")
-                            
-                            # Extract pure station codes for ML model
-                            origin_code = origin.split('_')[0] if '_' in origin else origin
-                            dest_code = destination.split('_')[0] if '_' in destination else destination
-                            intermediate_code = intermediate.split('_')[0] if '_' in intermediate else intermediate
-                            
-                            # Update ML model synchronously to ensure it's saved
-                            try:
-                                from train_route_learner import FastTrainRoutePredictor
-                                predictor = FastTrainRoutePredictor('train_stops.json', 'station_names.json')
-                                
-                                # Update the route with just the codes
-                                predictor.station_stats[intermediate_code]['success_count'] += 1
-                                predictor.station_stats[intermediate_code]['route_successes'][(origin_code, dest_code)] += 1
-                                
-                                # Save to the JSON file directly (not async)
-                                predictor.save_successful_routes('successful_routes.json')
-                                logger.info(f"Thread {thread_name}: Saved successful route via {intermediate_code}")
-                            except Exception as e:
-                                logger.error(f"Thread {thread_name}: Error saving route: {str(e)}")
-                            
-                            route = {
-                                'segments': [
-                                    {
-                                        'train_number': first_leg_details['train_number'],
-                                        'from_station': origin,
-                                        'to_station': intermediate,
-                                        'departure_time': first_leg_details['departure_time'],
-                                        'arrival_time': first_leg_details['arrival_time'],
-                                        'departure_date': first_leg_details['departure_date'],
-                                        'arrival_date': first_leg_details['arrival_date']
-                                    },
-                                    {
-                                        'train_number': second_leg_details['train_number'],
-                                        'from_station': intermediate,
-                                        'to_station': destination,
-                                        'departure_time': second_leg_details['departure_time'],
-                                        'arrival_time': second_leg_details['arrival_time'],
-                                        'departure_date': second_leg_details['departure_date'],
-                                        'arrival_date': second_leg_details['arrival_date']
-                                    }
-                                ]
-                            }
-                            result_queue.put(route)
-                            return  # Exit after finding a valid route
+            connections = match_connections(first_legs, available_second_legs, min_connection_time)
+            claimed = claim_connection(connections, intermediate, found_routes, found_routes_lock)
+            if claimed and not stop_event.is_set():
+                first_leg_details, second_leg_details = claimed
+                logger.info(f"Thread {thread_name}: Found valid route via candidate {intermediate}")
+                record_successful_route(origin, destination, intermediate)
+                result_queue.put(build_two_leg_route(origin, intermediate, destination,
+                                                     first_leg_details, second_leg_details))
 
         except Exception as e:
-            logger.error(f"Thread {thread_name}: Error processing ML station {intermediate}: {str(e)}")
+            logger.error(f"Thread {thread_name}: Error processing candidate station {intermediate}: {str(e)}")
             logger.debug(f"Thread {thread_name}: Full error details:", exc_info=True)
 
     
@@ -510,42 +734,133 @@ def find_routes(origin: str, destination: str, date: str, scrape_availability, s
         
         if direct_trains:
             logger.info(f"Found {len(direct_trains)} direct trains")
-            for train in direct_trains:
-                train_details = parse_train_details(train, date)
-                if train_details and train_details['has_seats']:
-                    logger.info(f"Found direct route with train {train_details['train_number']}")
-                    all_routes.append({
-                        'segments': [{
-                            'train_number': train_details['train_number'],
-                            'from_station': origin,
-                            'to_station': destination,
-                            'departure_time': train_details['departure_time'],
-                            'arrival_time': train_details['arrival_time'],
-                            'departure_date': train_details['departure_date'],
-                            'arrival_date': train_details['arrival_date']
-                        }]
-                    })
-                    if len(all_routes) >= max_routes:
-                        logger.info("Found required number of direct routes")
-                        return all_routes[:max_routes]  # Early return for direct routes
-
-        # Replace the Step 2 section in find_routes with this improved version
-    # Step 2: Try ML-predicted intermediate stations first (with multithreading)
-        if len(all_routes) < max_routes:
+            # Trains without readable times cannot be ranked or shown, as in the other steps
+            for train_details in parse_available_legs(direct_trains, date):
+                logger.info(f"Found direct route with train {train_details['train_number']}")
+                add_route({
+                    'segments': [{
+                        'train_number': train_details['train_number'],
+                        'from_station': origin,
+                        'to_station': destination,
+                        'departure_time': train_details['departure_time'],
+                        'arrival_time': train_details['arrival_time'],
+                        'departure_date': train_details['departure_date'],
+                        'arrival_date': train_details['arrival_date']
+                    }]
+                })
+                if enough():
+                    logger.info("Found required number of direct routes")
+                    return final_routes()  # Early return for direct routes
+
+        origin_code = station_code(origin)
+        dest_code = station_code(destination)
+        tried_codes = set()
+
+        def collect_results(worker_futures, label):
+            """Move routes from the result queue until enough are found or the workers finish"""
+            while not enough():
+                try:
+                    route = result_queue.get(timeout=0.1)
+                    add_route(route)
+                    logger.info(f"Added {label} route, now have {len(all_routes)}/{max_routes}")
+                except Exception:
+                    if all(future.done() for future in worker_futures):
+                        break
+
+        def drain(label, accept=None):
+            """Move routes already in the result queue without waiting; True once enough are found"""
+            while not enough() and not result_queue.empty():
+                (accept or add_route)(result_queue.get_nowait())
+                logger.info(f"Added {label} route, now have {len(all_routes)}/{max_routes}")
+            return enough()
+
+        def submit_each(step_executor, fn, task_args, label):
+            """
+            Submit tasks one at a time, stopping once enough routes are found.
+            Inside a batch the tasks run inline, so each one has finished
+            before the next is submitted.
+            """
+            step_futures = []
+            for args in task_args:
+                if stop_event.is_set() or drain(label):
+                    break
+                step_futures.append(step_executor.submit(fn, *args))
+            return step_futures
+
+        # Step 2: Check the legs of journeys proposed by the offline planner
+        if not enough():
+            if planned_journeys is None:
+                planned_journeys = journey_planner.alternatives(
+                    origin_code, dest_code, limit=max_planned_journeys, max_transfers=max_transfers
+                )
+            if planned_journeys:
+                logger.info(f"Journey planner proposed {len(planned_journeys)} journeys via "
+                            f"{[journey.transfer_stations for journey in planned_journeys]}")
+                for journey in planned_journeys:
+                    tried_codes.update(journey.transfer_stations)
+                
+                planner_executor = scrape_pool.request(min(5, len(planned_journeys)))
+                planner_futures = submit_each(planner_executor, process_planned_journey, [
+                    (journey, origin, destination, date,
+                     scrape_availability, result_queue, stop_event,
+                     found_routes, found_routes_lock, min_connection_time, ranker)
+                    for journey in planned_journeys
+                ], "planned")
+                collect_results(planner_futures, "planned")
+                planner_executor.shutdown(wait=False, cancel_futures=True)
+                
+                if enough():
+                    logger.info("Found required number of routes from planned journeys")
+                    return quick_shutdown()
+
+        # Step 3: Try intermediates that stored trains serve between origin and destination
+        if not enough():
+            preferred_codes = [station_code(station) for station in preferred_intermediates or []]
+            if bidirectional:
+                index_codes = timetable_index.meeting_stations(origin_code, dest_code)
+                logger.info(f"Bidirectional search: {len(index_codes)} stations reachable from both ends")
+            else:
+                index_codes = timetable_index.intermediates_between(origin_code, dest_code)
+            timetable_codes = [
+                code for code in dict.fromkeys(preferred_codes + index_codes)
+                if code not in tried_codes
+            ][:max_timetable_stations]
+            if timetable_codes:
+                timetable_stations = [timetable_index.station_with_name(code) for code in timetable_codes]
+                logger.info(f"Timetable index suggested {len(timetable_stations)} stations: {timetable_stations}")
+                tried_codes.update(timetable_codes)
+                
+                timetable_executor = scrape_pool.request(min(5, len(timetable_stations)))
+                timetable_futures = submit_each(timetable_executor, process_intermediate_station, [
+                    (intermediate, origin, destination, date,
+                     scrape_routes, scrape_availability, result_queue, stop_event,
+                     found_routes, found_routes_lock)
+                    for intermediate in timetable_stations
+                ], "timetable")
+                collect_results(timetable_futures, "timetable")
+                timetable_executor.shutdown(wait=False, cancel_futures=True)
+                if enough():
+                    logger.info("Found required number of routes using the timetable index")
+                    return quick_shutdown()
+            else:
+                logger.info(f"No stored train serves {origin_code} -> {dest_code}, skipping timetable candidates")
+
+    # Step 4: Try ML-predicted intermediate stations next (with multithreading)
+        if not enough():
             logger.info("Trying ML-predicted intermediate stations with multithreading...")
             try:
-                # Extract station codes from origin and destination (CODE_StationName format)
-                origin_code = origin.split('_')[0] if '_' in origin else origin
-                dest_code = destination.split('_')[0] if '_' in destination else destination
-                
                 # Import the predictor here to avoid circular imports
                 from train_route_learner import FastTrainRoutePredictor
                 
                 # Initialize the predictor
-                predictor = FastTrainRoutePredictor('train_stops.json', 'station_names.json')
+                predictor = FastTrainRoutePredictor('train_stops.json', 'station_names.json', stops_store=stops_store)
                 
                 # Get predicted intermediate stations
                 predicted_stations = predictor.predict_intermediate_stations(origin_code, dest_code)
+                predicted_stations = [
+                    station for station in predicted_stations
+                    if station_code(station) not in tried_codes
+                ]
                 
                 if predicted_stations:
                     logger.info(f"ML predictor suggested {len(predicted_stations)} stations: {predicted_stations}")
@@ -554,12 +869,19 @@ def find_routes(origin: str, destination: str, date: str, scrape_availability, s
                     max_ml_workers = min(5, len(predicted_stations))
                     logger.info(f"Starting {max_ml_workers} worker threads for ML stations")
                     
-                    ml_executor = ThreadPoolExecutor(max_workers=max_ml_workers, thread_name_prefix="MLWorker")
+                    ml_executor = scrape_pool.request(max_ml_workers)
                     ml_futures = []
                     
+                    def add_ml_route(route):
+                        add_route(route)
+                        # Update the ML model with the successful intermediate
+                        intermediate_code = station_code(route['segments'][1]['from_station'])
+                        predictor.update_route_async(origin_code, dest_code, intermediate_code)
+                        predictor.save_successful_routes('successful_routes.json')
+                    
                     # Submit all stations for processing in parallel
                     for station_with_name in predicted_stations:
-                        if stop_event.is_set() or len(all_routes) >= max_routes:
+                        if stop_event.is_set() or drain("ML-predicted", add_ml_route):
                             break
                             
                         # Extract station code from CODE_StationName format
@@ -567,7 +889,7 @@ def find_routes(origin: str, destination: str, date: str, scrape_availability, s
                         
                         # Submit the station for processing with the same parameters as process_single_route
                         future = ml_executor.submit(
-                            process_ml_station,
+                            process_intermediate_station,
                             intermediate, origin, destination, date,
                             scrape_routes, scrape_availability, result_queue, stop_event,
                             found_routes, found_routes_lock
@@ -577,25 +899,16 @@ def find_routes(origin: str, destination: str, date: str, scrape_availability, s
                     # Process results from the result queue immediately for faster response
                     check_start = time.time()
                     while time.time() - check_start < 5:  # Check for up to 5 seconds
-                        if stop_event.is_set() or len(all_routes) >= max_routes:
+                        if stop_event.is_set() or enough():
                             break
                             
                         try:
                             route = result_queue.get(timeout=0.1)  # Very short timeout
-                            all_routes.append(route)
-                            
-                            # Extract station code for ML model update
-                            intermediate = route['segments'][1]['from_station']
-                            intermediate_code = intermediate.split('_')[0] if '_' in intermediate else intermediate
-                            
-                            # Update the ML model with successful route
-                            predictor.update_route_async(origin_code, dest_code, intermediate_code)
-                            # Add this line to also save immediately in the main thread:
-                            predictor.save_successful_routes('successful_routes.json')
+                            add_ml_route(route)
                             
                             logger.info(f"Added ML-predicted route, now have {len(all_routes)}/{max_routes}")
                             
-                            if len(all_routes) >= max_routes:
+                            if enough():
                                 logger.info("Found required number of routes using ML predictions")
                                 ml_executor.shutdown(wait=False, cancel_futures=True)
                                 return quick_shutdown()
@@ -611,55 +924,232 @@ def find_routes(origin: str, destination: str, date: str, scrape_availability, s
                 logger.error(f"Error using ML predictor: {str(e)}")
                 logger.debug("Full error details:", exc_info=True)
 
-        # Step 3: Fall back to original multi-segment route finding if needed
-        if len(all_routes) < max_routes:
+        # Step 5: Fall back to original multi-segment route finding if needed
+        if not enough():
             logger.info("Checking multi-segment routes using original algorithm...")
             origin_trains = scrape_availability(origin, destination, date)
+            # Backward half of the bidirectional search: stations that reach the destination
+            meeting_codes = set(timetable_index.reaching(dest_code)) if bidirectional else None
             if not origin_trains:
-                return all_routes
-                
-            max_workers = min(3, len(origin_trains))
-            logger.info(f"Starting {max_workers} worker threads for {len(origin_trains)} trains")
+                logger.info("No direct trains to expand, skipping the fallback search")
+            else:
+                max_workers = min(3, len(origin_trains))
+                logger.info(f"Starting {max_workers} worker threads for {len(origin_trains)} trains")
             
-            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="RouteWorker")
+                executor = scrape_pool.request(max_workers)
             
-            for idx, train in enumerate(origin_trains):
-                if len(all_routes) >= max_routes:
-                    return quick_shutdown()
+                for idx, train in enumerate(origin_trains):
+                    if enough():
+                        return quick_shutdown()
                     
-                future = executor.submit(
-                    process_single_route,
-                    origin, destination, date, train,
-                    scrape_routes, scrape_availability, result_queue, stop_event,
-                    found_routes, found_routes_lock
-                )
-                futures.append(future)
+                    future = executor.submit(
+                        process_single_route,
+                        origin, destination, date, train,
+                        scrape_routes, scrape_availability, result_queue, stop_event,
+                        found_routes, found_routes_lock, min_connection_time, ranker, meeting_codes
+                    )
+                    futures.append(future)
                 
-                # Check queue immediately after each submission
-                while not result_queue.empty():
-                    route = result_queue.get_nowait()
-                    all_routes.append(route)
-                    logger.info(f"Found route {len(all_routes)}/{max_routes}")
-                    if len(all_routes) >= max_routes:
-                        logger.info("Required number of routes found, shutting down immediately")
-                        return quick_shutdown()
+                    # Check queue immediately after each submission
+                    while not result_queue.empty():
+                        route = result_queue.get_nowait()
+                        add_route(route)
+                        logger.info(f"Found route {len(all_routes)}/{max_routes}")
+                        if enough():
+                            logger.info("Required number of routes found, shutting down immediately")
+                            return quick_shutdown()
             
-            # Quick check for remaining results
-            while len(all_routes) < max_routes:
-                try:
-                    route = result_queue.get(timeout=0.1)  # Very short timeout
-                    all_routes.append(route)
-                    if len(all_routes) >= max_routes:
-                        return quick_shutdown()
-                except Exception:
-                    if all(future.done() for future in futures):
-                        break
-        
-        return all_routes[:max_routes]
+                # Quick check for remaining results
+                while not enough():
+                    try:
+                        route = result_queue.get(timeout=0.1)  # Very short timeout
+                        add_route(route)
+                        if enough():
+                            return quick_shutdown()
+                    except Exception:
+                        if all(future.done() for future in futures):
+                            break
+
+        # Step 6: Try two-transfer routes through timetable station pairs, with a strict scrape budget
+        if not enough() and max_transfer_pairs > 0 and not stop_event.is_set():
+            transfer_pairs = timetable_index.transfer_pairs(origin_code, dest_code, limit=max_transfer_pairs)
+            if transfer_pairs:
+                logger.info(f"Checking {len(transfer_pairs)} two-transfer station pairs: {transfer_pairs}")
+                pair_budget = ScrapeBudget(scrape_availability, max_transfer_pair_scrapes)
+                pair_executor = scrape_pool.request(min(3, len(transfer_pairs)))
+                pair_futures = submit_each(pair_executor, process_transfer_pair, [
+                    (timetable_index.station_with_name(first), timetable_index.station_with_name(second),
+                     origin, destination, date,
+                     pair_budget, result_queue, stop_event,
+                     found_routes, found_routes_lock, min_connection_time, ranker)
+                    for first, second in transfer_pairs
+                ], "two-transfer")
+                collect_results(pair_futures, "two-transfer")
+                pair_executor.shutdown(wait=False, cancel_futures=True)
+                logger.info(f"Two-transfer scrape budget: {pair_budget.get_stats()}")
+                if enough():
+                    return quick_shutdown()
+
+        return final_routes()
         
     finally:
         quick_shutdown()  # Ensure cleanup in all cases
 
+def find_routes_window(origin: str, destination: str, start_date: str, scrape_availability, scrape_routes,
+                       days: int = 3, max_routes: int = 1, cancel_token: Optional[CancelToken] = None,
+                       timeout: Optional[float] = None, **kwargs) -> Dict[str, List[Dict]]:
+    """
+    Find the best routes for each of `days` consecutive dates starting at
+    start_date, returned as {date: routes}.
+    
+    The days share one availability memo, so pages scraped for one day
+    (including the next-day second legs) are not loaded again for the next;
+    planner journeys are computed once; and transfer stations that gave a
+    route on an earlier day are tried first on the following days.
+    """
+    logger.info(f"Finding routes from {origin} to {destination} for {days} days from {start_date}")
+    
+    window_token = CancelToken(timeout=timeout, parent=cancel_token)
+    scrape_routes = bind_cancel_token(scrape_routes, window_token)
+    if not isinstance(scrape_availability, (ScrapeMemo, BoundScrapeMemo)):
+        scrape_availability = ScrapeMemo(scrape_availability)
+    scrape_availability = scrape_availability.bind(window_token)
+    
+    origin_code = station_code(origin)
+    dest_code = station_code(destination)
+    planned_journeys = kwargs.pop('planned_journeys', None)
+    if planned_journeys is None:
+        planned_journeys = journey_planner.alternatives(
+            origin_code, dest_code,
+            limit=kwargs.get('max_planned_journeys', 5), max_transfers=kwargs.get('max_transfers', 1)
+        )
+    preferred_intermediates = list(kwargs.pop('preferred_intermediates', None) or [])
+    
+    routes_by_date = {}
+    date = start_date
+    try:
+        for _ in range(days):
+            if window_token.is_cancelled():
+                logger.info(f"Date window search stopped before {date}: {window_token.reason}")
+                break
+            routes = find_routes(origin, destination, date, scrape_availability, scrape_routes,
+                                 max_routes=max_routes, cancel_token=window_token,
+                                 planned_journeys=planned_journeys,
+                                 preferred_intermediates=preferred_intermediates, **kwargs)
+            routes_by_date[date] = routes
+            for route in routes:
+                for segment in route['segments'][:-1]:
+                    if segment['to_station'] not in preferred_intermediates:
+                        preferred_intermediates.append(segment['to_station'])
+            date = get_next_day_date(date)
+    finally:
+        window_token.cancel("date window finished")
+    
+    logger.info(f"Date window memo stats: {scrape_availability.get_stats()}")
+    return routes_by_date
+
+def find_routes_batch(queries: List[Tuple[str, str, str]], scrape_availability, scrape_routes,
+                      max_routes: int = 1, max_parallel: int = 4, cancel_token: Optional[CancelToken] = None,
+                      timeout: Optional[float] = None, query_timeout: Optional[float] = None,
+                      **kwargs) -> List[Dict]:
+    """
+    Run many (origin, destination, date) searches together and return one
+    result per query, in input order: {'origin', 'destination', 'date',
+    'routes', 'error'}.
+    
+    Queries share one availability memo, so a page needed by several
+    queries (the same leg, or a shared hub) is loaded once. Identical
+    queries run once, planner journeys are computed once per station pair,
+    and queries from the same origin and date are scheduled next to each
+    other so their overlapping pages are still fresh in the memo.
+    """
+    logger.info(f"Running batch of {len(queries)} route searches with {max_parallel} workers")
+    
+    batch_token = CancelToken(timeout=timeout, parent=cancel_token)
+    scrape_routes = bind_cancel_token(scrape_routes, batch_token)
+    if not isinstance(scrape_availability, (ScrapeMemo, BoundScrapeMemo)):
+        scrape_availability = ScrapeMemo(scrape_availability)
+    scrape_availability = scrape_availability.bind(batch_token)
+    
+    unique_queries = sorted(set(queries), key=lambda query: (query[0], query[2], query[1]))
+    journeys_by_pair: Dict[Tuple[str, str], List[Journey]] = {}
+    for origin, destination, _ in unique_queries:
+        pair = (station_code(origin), station_code(destination))
+        if pair not in journeys_by_pair:
+            journeys_by_pair[pair] = journey_planner.alternatives(
+                pair[0], pair[1],
+                limit=kwargs.get('max_planned_journeys', 5), max_transfers=kwargs.get('max_transfers', 1)
+            )
+    
+    def run_query(query):
+        origin, destination, date = query
+        pair = (station_code(origin), station_code(destination))
+        return find_routes(origin, destination, date, scrape_availability, scrape_routes,
+                           max_routes=max_routes, cancel_token=batch_token, timeout=query_timeout,
+                           planned_journeys=journeys_by_pair[pair], **kwargs)
+    
+    results: Dict[Tuple[str, str, str], Dict] = {}
+    # Queries run on the shared pool; each query's own steps then run inline on its thread
+    executor = scrape_pool.request(max(1, min(max_parallel, len(unique_queries))))
+    try:
+        futures = {executor.submit(run_query, query): query for query in unique_queries}
+        for future in as_completed(futures):
+            query = futures[future]
+            result = {'origin': query[0], 'destination': query[1], 'date': query[2], 'routes': [], 'error': None}
+            try:
+                result['routes'] = future.result()
+                logger.info(f"✓ Batch query {query[0]} -> {query[1]} on {query[2]}: {len(result['routes'])} routes")
+            except Exception as e:
+                result['error'] = str(e)
+                logger.error(f"✗ Batch query {query[0]} -> {query[1]} on {query[2]} failed: {str(e)}")
+            results[query] = result
+    finally:
+        batch_token.cancel("batch finished")
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    logger.info(f"Batch memo stats: {scrape_availability.get_stats()}")
+    return [
+        dict(results.get(query) or {'origin': query[0], 'destination': query[1], 'date': query[2],
+                                    'routes': [], 'error': 'not run'})
+        for query in queries
+    ]
+
+def iter_routes(origin: str, destination: str, date: str, scrape_availability, scrape_routes,
+                max_routes: int = 1, **kwargs) -> Iterator[Dict]:
+    """
+    Generator version of find_routes: runs the search in a background thread
+    and yields each route as soon as it is found, instead of waiting for the
+    whole search to finish.
+    """
+    route_queue = Queue()
+    done = object()
+    stream_token = CancelToken(parent=kwargs.pop('cancel_token', None))
+    
+    def run_search():
+        try:
+            find_routes(origin, destination, date, scrape_availability, scrape_routes,
+                        max_routes=max_routes, on_route=route_queue.put,
+                        cancel_token=stream_token, **kwargs)
+        except Exception as e:
+            logger.error(f"Error in streamed route search: {str(e)}")
+        finally:
+            route_queue.put(done)
+    
+    search_thread = threading.Thread(target=run_search, name="RouteStream", daemon=True)
+    search_thread.start()
+    
+    yielded = 0
+    try:
+        while yielded < max_routes:
+            route = route_queue.get()
+            if route is done:
+                break
+            yielded += 1
+            yield route
+    finally:
+        # Consumer is gone or has enough routes: stop scraping for it
+        stream_token.cancel("stream closed")
+
 def print_routes(routes: List[Dict]):
     """Print routes with detailed timing information"""
     if not routes:
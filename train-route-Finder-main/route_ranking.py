@@ -0,0 +1,156 @@
+import heapq
+import itertools
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Minutes a transfer costs on top of its waiting time
+DEFAULT_TRANSFER_PENALTY = 60
+# Connections tighter than this are penalised for the missing minutes
+DEFAULT_SLACK_TARGET = 60
+
+def route_signature(route: Dict) -> Tuple:
+    """Identify a route by its trains and dates, so duplicates are ranked once"""
+    return tuple(
+        (segment['train_number'], segment['from_station'], segment['to_station'], segment['departure_date'])
+        for segment in route['segments']
+    )
+
+def travel_minutes(route: Dict) -> float:
+    """Door-to-door minutes from first departure to last arrival"""
+    segments = route['segments']
+    return (segments[-1]['arrival_time'] - segments[0]['departure_time']).total_seconds() / 60
+
+def transfer_slacks(route: Dict) -> List[float]:
+    """Minutes between arriving and departing at each transfer"""
+    segments = route['segments']
+    return [
+        (segments[i + 1]['departure_time'] - segments[i]['arrival_time']).total_seconds() / 60
+        for i in range(len(segments) - 1)
+    ]
+
+def route_cost(route: Dict, transfer_penalty: int = DEFAULT_TRANSFER_PENALTY,
+               slack_target: int = DEFAULT_SLACK_TARGET) -> float:
+    """
+    Single score for a route, lower is better: total travel time, plus a
+    fixed penalty per transfer, plus the minutes each connection falls
+    short of slack_target (tight connections are risky with delays).
+    """
+    slacks = transfer_slacks(route)
+    return (travel_minutes(route)
+            + transfer_penalty * len(slacks)
+            + sum(max(0.0, slack_target - slack) for slack in slacks))
+
+def route_objectives(route: Dict) -> Tuple[float, int, float]:
+    """
+    (travel minutes, legs, -tightest slack), all minimised, for Pareto
+    ranking. A route without transfers has no connection to miss, so it
+    gets the best possible slack.
+    """
+    slacks = transfer_slacks(route)
+    return travel_minutes(route), len(route['segments']), -min(slacks) if slacks else -float('inf')
+
+def dominates(a: Tuple, b: Tuple) -> bool:
+    return all(x <= y for x, y in zip(a, b)) and a != b
+
+class RouteRanker:
+    """
+    Keeps the K best routes seen so far in a bounded heap (worst on top),
+    plus the Pareto front over travel time, legs and transfer slack.
+    Thread-safe, so search workers can offer routes and ask whether a
+    candidate could still make the top K before scraping for it.
+    """
+
+    def __init__(self, k: int, transfer_penalty: int = DEFAULT_TRANSFER_PENALTY,
+                 slack_target: int = DEFAULT_SLACK_TARGET):
+        self.k = k
+        self.transfer_penalty = transfer_penalty
+        self.slack_target = slack_target
+        self.heap: List[Tuple[float, int, Dict]] = []
+        self.front: List[Tuple[Tuple, Dict]] = []
+        self.seen = set()
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.offered = 0
+        self.pruned = 0
+
+    def offer(self, route: Dict) -> bool:
+        """Add a route; returns True if it entered the top K or the Pareto front"""
+        signature = route_signature(route)
+        cost = route_cost(route, self.transfer_penalty, self.slack_target)
+        objectives = route_objectives(route)
+        with self.lock:
+            if signature in self.seen:
+                return False
+            self.seen.add(signature)
+            self.offered += 1
+
+            kept = False
+            entry = (-cost, next(self.counter), route)
+            if len(self.heap) < self.k:
+                heapq.heappush(self.heap, entry)
+                kept = True
+            elif cost < -self.heap[0][0]:
+                heapq.heapreplace(self.heap, entry)
+                kept = True
+
+            if not any(dominates(other, objectives) or other == objectives for other, _ in self.front):
+                self.front = [(other, r) for other, r in self.front if not dominates(objectives, other)]
+                self.front.append((objectives, route))
+                kept = True
+            return kept
+
+    def worst_cost(self) -> Optional[float]:
+        """Cost a new route must beat to enter a full top K, or None while it is not full"""
+        with self.lock:
+            return -self.heap[0][0] if len(self.heap) >= self.k else None
+
+    def can_improve(self, lower_bound: Optional[float]) -> bool:
+        """
+        Whether a candidate whose routes cost at least lower_bound could still
+        enter the top K. Counts the candidates skipped.
+        """
+        worst = self.worst_cost()
+        if worst is None or lower_bound is None or lower_bound < worst:
+            return True
+        with self.lock:
+            self.pruned += 1
+        return False
+
+    def best(self) -> List[Dict]:
+        """The top K routes, best first"""
+        with self.lock:
+            return [route for _, _, route in sorted(self.heap, key=lambda entry: (-entry[0], entry[1]))]
+
+    def pareto_front(self) -> List[Dict]:
+        """Routes no other route beats on every objective, fastest first"""
+        with self.lock:
+            return [route for _, route in sorted(self.front, key=lambda item: item[0])]
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get ranking statistics"""
+        return {
+            'offered': self.offered,
+            'kept': len(self.heap),
+            'front': len(self.front),
+            'pruned': self.pruned
+        }
+
+if __name__ == "__main__":
+    # Self-check: a faster direct route must push a slower transfer route off the Pareto front
+    from datetime import datetime
+
+    def segment(number, departure, arrival):
+        return {'train_number': number, 'from_station': 'A', 'to_station': 'B', 'departure_date': '20250301',
+                'departure_time': datetime(2025, 3, 1, *departure), 'arrival_time': datetime(2025, 3, 1, *arrival)}
+
+    direct = {'segments': [segment('D1', (6, 0), (12, 0))]}
+    transfer = {'segments': [segment('T1', (6, 0), (12, 0)), segment('T2', (15, 0), (20, 0))]}
+    ranker = RouteRanker(2)
+    ranker.offer(transfer)
+    ranker.offer(direct)
+    assert ranker.pareto_front() == [direct], ranker.pareto_front()
+    assert ranker.best() == [direct, transfer], ranker.best()
+    print("✓ Route ranking self-check passed")
@@ -0,0 +1,168 @@
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as WaitTimeout
+from typing import Any, Callable, Dict, Optional, Tuple
+from cancellation import CancelToken, SearchCancelled, bind_cancel_token
+
+logger = logging.getLogger(__name__)
+
+class ScrapeMemo:
+    """
+    Request-scoped memo around a scrape function with single-flight
+    semantics: the first caller for a (from, to, date) key runs the scrape,
+    concurrent callers for the same key wait on its result, and later
+    callers get the stored result. Failed scrapes (None) are remembered too,
+    so one search never loads the same page twice, unless the scrape was cut
+    short by its caller's cancel token.
+    """
+
+    def __init__(self, scrape_fn: Callable):
+        self.scrape_fn = scrape_fn
+        self.lock = threading.Lock()
+        self.entries: Dict[Tuple, Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+
+    @staticmethod
+    def make_key(from_station: str, to_station: str, date: str, **kwargs) -> Tuple:
+        # The cancel token only controls how long the scrape may take
+        kwargs.pop('cancel_token', None)
+        return (from_station, to_station, date, tuple(sorted(kwargs.items())))
+
+    def contains(self, from_station: str, to_station: str, date: str, **kwargs) -> bool:
+        """Whether a scrape for this key has already been started"""
+        with self.lock:
+            return self.make_key(from_station, to_station, date, **kwargs) in self.entries
+
+    def bind(self, cancel_token: Optional[CancelToken]) -> 'BoundScrapeMemo':
+        """View of this memo whose calls scrape and wait under cancel_token"""
+        return BoundScrapeMemo(self, cancel_token)
+
+    @staticmethod
+    def _wait(entry: Future, cancel_token: Optional[CancelToken]) -> Any:
+        """Result of another caller's scrape, or None if our own token is cancelled first"""
+        if cancel_token is None:
+            return entry.result()
+        while True:
+            try:
+                return entry.result(timeout=0.5)
+            except WaitTimeout:
+                if cancel_token.is_cancelled():
+                    return None
+
+    def __call__(self, from_station: str, to_station: str, date: str, **kwargs) -> Any:
+        cancel_token = kwargs.pop('cancel_token', None)
+        key = self.make_key(from_station, to_station, date, **kwargs)
+
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is None:
+                    entry = Future()
+                    self.entries[key] = entry
+                    self.misses += 1
+                    is_leader = True
+                else:
+                    if entry.done():
+                        self.hits += 1
+                    else:
+                        self.waits += 1
+                    is_leader = False
+
+            if is_leader:
+                break
+            logger.debug(f"Memo {'hit' if entry.done() else 'wait'} for {from_station} -> {to_station} on {date}")
+            try:
+                return self._wait(entry, cancel_token)
+            except SearchCancelled:
+                # The scrape was cancelled with the search that started it; load it for ours
+                if cancel_token is not None and cancel_token.is_cancelled():
+                    return None
+
+        scrape_fn = bind_cancel_token(self.scrape_fn, cancel_token) if cancel_token is not None else self.scrape_fn
+        try:
+            result = scrape_fn(from_station, to_station, date, **kwargs)
+        except BaseException as e:
+            # Let waiting callers see the failure, but allow a later retry
+            with self.lock:
+                self.entries.pop(key, None)
+            entry.set_exception(e)
+            raise
+        if result is None and cancel_token is not None and cancel_token.is_cancelled():
+            # A page load abandoned by its search says nothing about the page
+            with self.lock:
+                self.entries.pop(key, None)
+            entry.set_exception(SearchCancelled(cancel_token.reason or "cancelled"))
+            return None
+        entry.set_result(result)
+        return result
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get memo statistics"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'waits': self.waits,
+            'entries': len(self.entries)
+        }
+
+class BoundScrapeMemo:
+    """
+    A ScrapeMemo seen from one search: calls pass the search's cancel token,
+    so its page loads and waits stop with it, while entries and statistics
+    stay shared with every other search using the memo.
+    """
+
+    def __init__(self, memo: ScrapeMemo, cancel_token: Optional[CancelToken]):
+        self.memo = memo
+        self.cancel_token = cancel_token
+
+    def bind(self, cancel_token: Optional[CancelToken]) -> 'BoundScrapeMemo':
+        return self.memo.bind(cancel_token)
+
+    def contains(self, from_station: str, to_station: str, date: str, **kwargs) -> bool:
+        return self.memo.contains(from_station, to_station, date, **kwargs)
+
+    def __call__(self, from_station: str, to_station: str, date: str, **kwargs) -> Any:
+        kwargs.setdefault('cancel_token', self.cancel_token)
+        return self.memo(from_station, to_station, date, **kwargs)
+
+    def get_stats(self) -> Dict[str, int]:
+        return self.memo.get_stats()
+
+class ScrapeBudget:
+    """
+    Caps the number of new pages a search step may load through a memo.
+    Pages the memo already has are free; once the budget is spent further
+    uncached scrapes return None instead of opening a browser.
+    """
+
+    def __init__(self, memo: ScrapeMemo, limit: int):
+        self.memo = memo
+        self.limit = limit
+        self.used = 0
+        self.refused = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, from_station: str, to_station: str, date: str, **kwargs) -> Any:
+        if not self.memo.contains(from_station, to_station, date, **kwargs):
+            with self.lock:
+                if self.used >= self.limit:
+                    self.refused += 1
+                    logger.debug(f"Scrape budget spent, skipping {from_station} -> {to_station} on {date}")
+                    return None
+                self.used += 1
+        return self.memo(from_station, to_station, date, **kwargs)
+
+    def exhausted(self) -> bool:
+        with self.lock:
+            return self.used >= self.limit
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get budget statistics"""
+        return {
+            'limit': self.limit,
+            'used': self.used,
+            'refused': self.refused
+        }
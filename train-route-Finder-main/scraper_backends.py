@@ -0,0 +1,271 @@
+import asyncio
+import functools
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+from cancellation import CancelToken
+from train_stops_store import station_code
+
+logger = logging.getLogger(__name__)
+
+class ScraperBackend(ABC):
+    """
+    Interface for anything that can fetch Paytm search result pages.
+    Methods are coroutines so one event loop can drive many fetches and
+    cancel them with ordinary asyncio cancellation.
+    """
+
+    @abstractmethod
+    async def fetch_availability(self, from_station: str, to_station: str, date: str,
+                                 target_train_number: Optional[str] = None) -> Optional[List[dict]]:
+        """Trains with seat availability, in scrape_train_data's format"""
+
+    @abstractmethod
+    async def fetch_routes(self, from_station: str, to_station: str, date: str,
+                           target_train_number: Optional[str] = None) -> Optional[List[dict]]:
+        """Trains with their stops, in scrape_train_routes' format"""
+
+    async def close(self):
+        """Release any resources held by the backend"""
+
+class SeleniumBackend(ScraperBackend):
+    """
+    Adapter that keeps the existing blocking Selenium scrapers working behind
+    the async interface by running them on a small dedicated thread pool.
+    It must not use the shared scraping pool: find_routes workers on that
+    pool block waiting for these fetches, so a full pool would never run
+    them. Each fetch passes the scraper its own cancel token, and cancelling
+    the fetch cancels the token, so the page load stops and its pooled
+    browser is released instead of loading on in the worker thread.
+    """
+
+    def __init__(self, max_workers: int = 3):
+        from train_availability_scraper import scrape_train_data
+        from train_route_scraper import scrape_train_routes
+        self.scrape_train_data = scrape_train_data
+        self.scrape_train_routes = scrape_train_routes
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="SeleniumBackend")
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        cancel_token = CancelToken()
+        try:
+            return await loop.run_in_executor(self.executor,
+                                              functools.partial(fn, *args, cancel_token=cancel_token, **kwargs))
+        except asyncio.CancelledError:
+            cancel_token.cancel("fetch cancelled")
+            raise
+
+    async def fetch_availability(self, from_station, to_station, date, target_train_number=None):
+        return await self._run(self.scrape_train_data, from_station, to_station, date,
+                               target_train_number=target_train_number)
+
+    async def fetch_routes(self, from_station, to_station, date, target_train_number=None):
+        return await self._run(self.scrape_train_routes, from_station, to_station, date,
+                               target_train_number=target_train_number)
+
+    async def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class FakeBackend(ScraperBackend):
+    """
+    Local in-memory backend for tests and benchmarks. Pages are keyed by
+    (from_code, to_code, date); station names after the code are ignored.
+    Every fetch is recorded in `calls`.
+    """
+
+    def __init__(self, availability: Optional[Dict[Tuple[str, str, str], List[dict]]] = None,
+                 routes: Optional[Dict[Tuple[str, str, str], List[dict]]] = None,
+                 latency: float = 0.0):
+        self.availability = availability or {}
+        self.routes = routes or {}
+        self.latency = latency
+        self.calls: List[Tuple[str, str, str, str]] = []
+
+    async def _fetch(self, kind, pages, from_station, to_station, date, target_train_number):
+        self.calls.append((kind, from_station, to_station, date))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        trains = pages.get((station_code(from_station), station_code(to_station), date), [])
+        if target_train_number:
+            trains = [train for train in trains if train.get('number') == target_train_number]
+        return list(trains)
+
+    async def fetch_availability(self, from_station, to_station, date, target_train_number=None):
+        return await self._fetch('availability', self.availability, from_station, to_station, date,
+                                 target_train_number)
+
+    async def fetch_routes(self, from_station, to_station, date, target_train_number=None):
+        return await self._fetch('routes', self.routes, from_station, to_station, date,
+                                 target_train_number)
+
+class ReplayBackend(ScraperBackend):
+    """
+    Serves results pages recorded in a PageArchive, parsed offline with
+    lxml, so find_routes can be rerun and benchmarked without Chrome or the
+    network. Pages missing from the archive come back as None, like a
+    failed scrape. Every fetch is recorded in `calls`.
+    """
+
+    def __init__(self, archive=None, latency: float = 0.0):
+        import offline_parser
+        if not offline_parser.has_lxml:
+            raise RuntimeError("ReplayBackend needs lxml (pip install lxml)")
+        from page_archive import page_archive
+        self.parser = offline_parser
+        self.archive = archive or page_archive
+        self.latency = latency
+        self.calls: List[Tuple[str, str, str, str]] = []
+        self.misses = 0
+
+    async def _load(self, kind, from_station, to_station, date):
+        self.calls.append((kind, from_station, to_station, date))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        page = self.archive.load(from_station, to_station, date)
+        if page is None:
+            self.misses += 1
+            logger.debug(f"No archived page for {from_station} -> {to_station} on {date}")
+        return page
+
+    async def fetch_availability(self, from_station, to_station, date, target_train_number=None):
+        page = await self._load('availability', from_station, to_station, date)
+        if page is None:
+            return None
+        return self.parser.parse_train_data(page, target_train_number)
+
+    async def fetch_routes(self, from_station, to_station, date, target_train_number=None):
+        page = await self._load('routes', from_station, to_station, date)
+        if page is None:
+            return None
+        if target_train_number:
+            route_page = self.archive.load(from_station, to_station, date, target_train_number)
+            route_pages = {target_train_number: route_page} if route_page is not None else {}
+        else:
+            route_pages = self.archive.route_pages(from_station, to_station, date)
+        return self.parser.parse_train_routes(page, route_pages, target_train_number)
+
+class BackendRunner:
+    """
+    Runs a backend on its own event loop thread and exposes the blocking
+    scrape_availability / scrape_routes callables that find_routes expects,
+    so worker threads share one loop instead of each blocking on a page.
+    """
+
+    def __init__(self, backend: ScraperBackend, timeout: Optional[float] = None):
+        self.backend = backend
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="ScraperLoop", daemon=True)
+        self.thread.start()
+
+    def submit(self, coroutine):
+        """Schedule a coroutine on the backend loop, returning a concurrent Future"""
+        with self.lock:
+            if self.closed:
+                coroutine.close()
+                raise RuntimeError("Backend runner is closed")
+            return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def _call(self, coroutine, cancel_token=None):
+        try:
+            future = self.submit(coroutine)
+        except RuntimeError as e:
+            logger.warning(f"Backend fetch skipped: {str(e)}")
+            return None
+        if cancel_token is not None:
+            cancel_token.add_callback(future.cancel)
+        try:
+            return future.result(cancel_token.timeout_for(self.timeout or 3600) if cancel_token else self.timeout)
+        except CancelledError:
+            logger.info("Backend fetch cancelled")
+            return None
+        except Exception as e:
+            future.cancel()
+            if cancel_token is not None and cancel_token.is_cancelled():
+                logger.info(f"Backend fetch cancelled: {cancel_token.reason}")
+                return None
+            logger.error(f"Backend fetch failed: {str(e) or type(e).__name__}")
+            return None
+
+    def scrape_availability(self, from_station, to_station, date, target_train_number=None,
+                            cancel_token=None, **kwargs):
+        return self._call(self.backend.fetch_availability(from_station, to_station, date, target_train_number),
+                          cancel_token)
+
+    def scrape_routes(self, from_station, to_station, date, target_train_number=None,
+                      cancel_token=None, **kwargs):
+        return self._call(self.backend.fetch_routes(from_station, to_station, date, target_train_number),
+                          cancel_token)
+
+    def fetch_many(self, queries: Iterable[Tuple[str, str, str]]) -> List[Optional[List[dict]]]:
+        """Fetch availability for many (from, to, date) queries concurrently on the loop"""
+        return self.submit(gather_availability(self.backend, queries)).result(self.timeout)
+
+    def close(self):
+        """Cancel outstanding fetches, close the backend and stop the loop thread"""
+        async def shutdown():
+            current = asyncio.current_task()
+            for task in asyncio.all_tasks():
+                if task is not current:
+                    task.cancel()
+            await self.backend.close()
+
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            future = asyncio.run_coroutine_threadsafe(shutdown(), self.loop)
+        try:
+            future.result(self.timeout)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=5)
+
+async def gather_availability(backend: ScraperBackend,
+                              queries: Iterable[Tuple[str, str, str]]) -> List[Optional[List[dict]]]:
+    """Fetch availability for many queries at once; failed fetches come back as None"""
+    results = await asyncio.gather(
+        *(backend.fetch_availability(from_station, to_station, date) for from_station, to_station, date in queries),
+        return_exceptions=True
+    )
+    return [None if isinstance(result, BaseException) else result for result in results]
+
+def find_routes_with_backend(origin: str, destination: str, date: str, backend: ScraperBackend, **kwargs):
+    """
+    Run find_routes with every page fetch going through a scraper backend.
+    The search's workers wait on the backend, so the backend must do its
+    blocking work on threads of its own, never on the shared scraping pool.
+    """
+    from route_finder import find_routes
+
+    runner = BackendRunner(backend)
+    try:
+        return find_routes(origin, destination, date, runner.scrape_availability, runner.scrape_routes, **kwargs)
+    finally:
+        runner.close()
+
+if __name__ == "__main__":
+    # Self-check: run a search and a batch fetch against FakeBackend, without Chrome or the network
+    logging.basicConfig(level=logging.WARNING)
+    date = "20250301"
+    direct = {'name': 'Rajdhani', 'number': '12302', 'departure_time': '16:50', 'arrival_time': '09:55',
+              'duration': '17h 5m', 'classes_and_availability': [{'type': '3A', 'availability': 'AVL 12',
+                                                                  'price': '₹2,965'}]}
+    backend = FakeBackend(availability={('NDLS', 'HWH', date): [direct]}, latency=0.01)
+
+    routes = find_routes_with_backend("NDLS_NewDelhi", "HWH_Howrah", date, backend, max_routes=1)
+    assert routes and routes[0]['segments'][0]['train_number'] == '12302', routes
+    assert ('availability', "NDLS_NewDelhi", "HWH_Howrah", date) in backend.calls, backend.calls
+
+    runner = BackendRunner(backend, timeout=10)
+    try:
+        pages = runner.fetch_many([("NDLS", "HWH", date), ("NDLS", "CNB", date)])
+    finally:
+        runner.close()
+    assert pages == [[direct], []], pages
+    print(f"✓ FakeBackend self-check passed ({len(backend.calls)} fetches)")
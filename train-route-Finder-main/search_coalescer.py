@@ -0,0 +1,89 @@
+import copy
+import logging
+import threading
+from typing import Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class InFlightSearch:
+    """State of one running search shared by its leader and followers"""
+
+    def __init__(self):
+        self.routes: List[dict] = []
+        self.result: Optional[List[dict]] = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+        self.followers = 0
+        self.lock = threading.Lock()
+
+    def add_route(self, route: dict):
+        with self.lock:
+            self.routes.append(route)
+
+    def partial_routes(self) -> List[dict]:
+        with self.lock:
+            return list(self.routes)
+
+class SearchCoalescer:
+    """
+    Coalesces identical route searches running at the same time. The first
+    request for a key becomes the leader and runs the search; requests that
+    arrive while it is running attach as followers and get the leader's
+    result, or the routes found so far if they stop waiting early.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight: Dict[Hashable, InFlightSearch] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def search(self, key: Hashable, run: Callable[[Callable[[dict], None]], List[dict]],
+               wait_timeout: Optional[float] = None) -> List[dict]:
+        """
+        Run or join the search for `key`.
+
+        Args:
+            key: Search parameters identifying identical searches
+            run: Called by the leader with an on_route callback; returns the routes
+            wait_timeout: Seconds a follower waits before taking partial results
+        """
+        with self.lock:
+            search = self.in_flight.get(key)
+            is_leader = search is None
+            if is_leader:
+                search = InFlightSearch()
+                self.in_flight[key] = search
+                self.leaders += 1
+            else:
+                search.followers += 1
+                self.followers += 1
+
+        if not is_leader:
+            logger.info(f"Joining in-flight search {key} ({search.followers} followers)")
+            if not search.done.wait(wait_timeout):
+                logger.info(f"Search {key} still running, returning {len(search.routes)} partial routes")
+                return copy.deepcopy(search.partial_routes())
+            if search.error is not None:
+                raise search.error
+            return copy.deepcopy(search.result)
+
+        try:
+            search.result = run(search.add_route)
+            # Callers decorate their routes, so never hand out the shared copy
+            return copy.deepcopy(search.result)
+        except BaseException as e:
+            search.error = e
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+            search.done.set()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get coalescing statistics"""
+        return {
+            'leaders': self.leaders,
+            'followers': self.followers,
+            'in_flight': len(self.in_flight)
+        }
@@ -0,0 +1,218 @@
+import threading
+import logging
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from train_stops_store import NO_TIME, TrainStopsStore, TrainTimetable
+
+logger = logging.getLogger(__name__)
+
+class StopCall(NamedTuple):
+    """A single train calling at a station"""
+    train_number: str
+    position: int
+    arrival_minute: Optional[int]
+    departure_minute: Optional[int]
+
+def format_station_name(code: str, name: str) -> str:
+    """Format a station as CODE_StationName, matching the route finder"""
+    return f"{code}_{''.join(word.capitalize() for word in name.split())}"
+
+class TimetableIndex:
+    """
+    In-memory index over the stored train stops: station code -> trains
+    calling there, with stop position and minute offsets. Lets the route
+    finder work out which stations a train really serves between two
+    points without opening a browser.
+    """
+
+    def __init__(self, store: TrainStopsStore):
+        self.store = store
+        self.station_calls: Dict[str, List[StopCall]] = defaultdict(list)
+        self.train_stations: Dict[str, List[str]] = {}
+        self.station_names: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        self.build()
+        store.add_listener(self.add_train)
+
+    def build(self):
+        """(Re)build the index from every train in the store"""
+        with self.lock:
+            self.station_calls = defaultdict(list)
+            self.train_stations = {}
+            for train_number, stops in list(self.store.stops.items()):
+                self._index_train(train_number, stops, self.store.get_timetable(train_number))
+        logger.info(f"✓ Indexed {len(self.train_stations)} trains over {len(self.station_calls)} stations")
+
+    def add_train(self, train_number: str, stops: List[dict]):
+        """Index (or re-index) a single train"""
+        with self.lock:
+            if train_number in self.train_stations:
+                self._remove_train(train_number)
+            self._index_train(train_number, stops, self.store.get_timetable(train_number))
+
+    def _remove_train(self, train_number: str):
+        for code in set(self.train_stations.pop(train_number, [])):
+            self.station_calls[code] = [
+                call for call in self.station_calls[code] if call.train_number != train_number
+            ]
+
+    def _index_train(self, train_number: str, stops: List[dict], timetable: Optional[TrainTimetable]):
+        if not stops or timetable is None:
+            return
+        codes = []
+        for position, code in enumerate(timetable.station_codes):
+            if not code:
+                continue
+            codes.append(code)
+            if code not in self.station_names and 'station_name' in stops[position]:
+                self.station_names[code] = stops[position]['station_name']
+            arrival = timetable.arrival_minutes[position]
+            departure = timetable.departure_minutes[position]
+            self.station_calls[code].append(StopCall(
+                train_number, position,
+                arrival if arrival != NO_TIME else None,
+                departure if departure != NO_TIME else None
+            ))
+        self.train_stations[train_number] = codes
+
+    def calls_at(self, station_code: str) -> List[StopCall]:
+        """Trains calling at a station"""
+        return list(self.station_calls.get(station_code, []))
+
+    def trains_between(self, origin_code: str, dest_code: str) -> List[Tuple[StopCall, StopCall]]:
+        """Trains calling at origin and then, later on the same run, at destination"""
+        with self.lock:
+            dest_calls = {call.train_number: call for call in self.station_calls.get(dest_code, [])}
+            pairs = []
+            for call in self.station_calls.get(origin_code, []):
+                dest_call = dest_calls.get(call.train_number)
+                if dest_call and dest_call.position > call.position:
+                    pairs.append((call, dest_call))
+            return pairs
+
+    def min_travel_minutes(self, origin_code: str, dest_code: str) -> Optional[int]:
+        """Shortest in-train time from origin to destination over stored trains, if any serve it"""
+        durations = [
+            dest_call.arrival_minute - origin_call.departure_minute
+            for origin_call, dest_call in self.trains_between(origin_code, dest_code)
+            if origin_call.departure_minute is not None and dest_call.arrival_minute is not None
+        ]
+        return min(durations) if durations else None
+
+    def reachable_from(self, origin_code: str) -> Dict[str, int]:
+        """Stations some stored train reaches after calling at origin, with the shortest in-train minutes"""
+        return self._reach(origin_code, forward=True)
+
+    def reaching(self, dest_code: str) -> Dict[str, int]:
+        """Stations from which some stored train reaches destination, with the shortest in-train minutes"""
+        return self._reach(dest_code, forward=False)
+
+    def _reach(self, station_code: str, forward: bool) -> Dict[str, int]:
+        minutes: Dict[str, int] = {}
+        with self.lock:
+            calls = list(self.station_calls.get(station_code, []))
+        for call in calls:
+            timetable = self.store.get_timetable(call.train_number)
+            if timetable is None:
+                continue
+            if forward:
+                start = timetable.departure_minutes[call.position]
+                positions = range(call.position + 1, len(timetable.station_codes))
+            else:
+                end = timetable.arrival_minutes[call.position]
+                positions = range(call.position)
+            for position in positions:
+                code = timetable.station_codes[position]
+                if forward:
+                    other = timetable.arrival_minutes[position]
+                    duration = other - start if NO_TIME not in (start, other) else None
+                else:
+                    other = timetable.departure_minutes[position]
+                    duration = end - other if NO_TIME not in (end, other) else None
+                if not code or code == station_code or duration is None:
+                    continue
+                if code not in minutes or duration < minutes[code]:
+                    minutes[code] = duration
+        return minutes
+
+    def meeting_stations(self, origin_code: str, dest_code: str, limit: Optional[int] = None) -> List[str]:
+        """
+        Bidirectional candidates: stations reached forward from origin's trains
+        and backward from destination's trains, so one stored train covers
+        each leg. Ranked by total in-train time through the station.
+        """
+        forward = self.reachable_from(origin_code)
+        backward = self.reaching(dest_code)
+        common = (set(forward) & set(backward)) - {origin_code, dest_code}
+        codes = sorted(common, key=lambda code: (forward[code] + backward[code], code))
+        return codes[:limit] if limit else codes
+
+    def transfer_pairs(self, origin_code: str, dest_code: str, max_first: int = 10, max_second: int = 10,
+                       limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        """
+        (first, second) transfer stations for origin -> first -> second ->
+        destination routes where a stored train covers every leg, fastest
+        total in-train time first. Only the max_first stations closest to
+        origin and max_second closest to destination are paired, so the
+        expansion stays bounded at max_first * max_second lookups, and no
+        station is used in more than two pairs.
+        """
+        forward = self.reachable_from(origin_code)
+        backward = self.reaching(dest_code)
+        for code in (origin_code, dest_code):
+            forward.pop(code, None)
+            backward.pop(code, None)
+        firsts = sorted(forward, key=forward.get)[:max_first]
+        seconds = sorted(backward, key=backward.get)[:max_second]
+
+        pairs = []
+        for first in firsts:
+            for second in seconds:
+                if first == second:
+                    continue
+                middle = self.min_travel_minutes(first, second)
+                if middle is not None:
+                    pairs.append((forward[first] + middle + backward[second], first, second))
+        pairs.sort()
+        # Spread the pairs over stations instead of pairing one station with everything
+        uses: Dict[str, int] = defaultdict(int)
+        result = []
+        for _, first, second in pairs:
+            if uses[first] >= 2 or uses[second] >= 2:
+                continue
+            uses[first] += 1
+            uses[second] += 1
+            result.append((first, second))
+            if limit and len(result) >= limit:
+                break
+        return result
+
+    def intermediates_between(self, origin_code: str, dest_code: str, limit: Optional[int] = None) -> List[str]:
+        """
+        Station codes that a stored train serves strictly between origin and
+        destination, in the right direction. Stations served by more trains
+        come first, ties broken by how early they fall on the journey.
+        """
+        scores: Dict[str, List[float]] = {}
+        for origin_call, dest_call in self.trains_between(origin_code, dest_code):
+            timetable = self.store.get_timetable(origin_call.train_number)
+            if timetable is None:
+                continue
+            span = dest_call.position - origin_call.position
+            for position in range(origin_call.position + 1, dest_call.position):
+                code = timetable.station_codes[position]
+                if not code or code in (origin_code, dest_code):
+                    continue
+                entry = scores.setdefault(code, [0, 1.0])
+                entry[0] += 1
+                entry[1] = min(entry[1], (position - origin_call.position) / span)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1][0], item[1][1]))
+        codes = [code for code, _ in ranked]
+        return codes[:limit] if limit else codes
+
+    def station_with_name(self, code: str) -> str:
+        """Format a station code as CODE_StationName using indexed names"""
+        name = self.station_names.get(code)
+        return format_station_name(code, name) if name else code
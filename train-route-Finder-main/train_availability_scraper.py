@@ -1,224 +1,242 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-import time
+from selenium.common.exceptions import TimeoutException
 import logging
-import random
 import threading
-from threading import local
-import atexit
-from typing import Dict
-from threading import Lock
+from availability_cache import AvailabilityCache
+from negative_cache import FAILED, NegativeCache
+from cancellation import CancelToken, SearchCancelled
+from driver_pool import driver_pool, wait_for_stable_count
+from rate_limiter import rate_limiter
+from page_archive import page_archive
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Thread-local storage for browser instances
-thread_local = local()
-browser_instances: Dict[int, webdriver.Chrome] = {}
-browser_lock = Lock()
+# Process-wide cache of scraped availability shared by all searches
+availability_cache = AvailabilityCache()
+# Searches that recently found no trains or failed, so they are not retried at once
+negative_cache = NegativeCache()
 
-def get_random_user_agent():
-    user_agents = [
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15",
-    ]
-    return random.choice(user_agents)
+# Walks every train card in the browser and returns the same fields the
+# scraper used to read element by element, in one WebDriver round trip.
+EXTRACT_TRAINS_SCRIPT = """
+const target = arguments[0];
+const text = (root, selector) => {
+    const element = root.querySelector(selector);
+    return element ? element.innerText.trim() : null;
+};
+const texts = (root, selector) =>
+    Array.from(root.querySelectorAll(selector), element => element.innerText.trim());
+const stripParens = value => value.replace(/^[()]+|[()]+$/g, '');
 
-def get_thread_driver():
-    """Get or create a thread-specific browser instance"""
-    thread_id = threading.get_ident()
-    
-    with browser_lock:
-        if thread_id not in browser_instances:
-            options = Options()
-            options.add_argument("--headless")
-            options.add_argument("--disable-gpu")
-            options.add_argument("--no-sandbox")
-            options.add_argument("--disable-dev-shm-usage")
-            options.add_argument(f"user-agent={get_random_user_agent()}")
-            options.add_experimental_option("excludeSwitches", ["enable-automation"])
-            options.add_experimental_option('useAutomationExtension', False)
-            
-            driver = webdriver.Chrome(options=options)
-            driver.set_page_load_timeout(30)
-            driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
-                "source": """
-                    Object.defineProperty(navigator, 'webdriver', {
-                        get: () => undefined
-                    })
-                """
-            })
-            
-            browser_instances[thread_id] = driver
-            logger.info(f"Created new browser instance for thread {thread_id}")
-            
-        return browser_instances[thread_id]
+const trains = [];
+const skipped = [];
+for (const card of document.getElementsByClassName('Gwgxn')) {
+    const nameNumber = card.querySelector('.k9j0o');
+    const name = nameNumber && text(nameNumber, 'h1');
+    const number = nameNumber && text(nameNumber, '.qW4yv');
+    if (name === null || number === null) {
+        skipped.push(card.innerText.slice(0, 60));
+        continue;
+    }
+    const train = {name: name, number: stripParens(number)};
+    if (target && train.number !== target) {
+        continue;
+    }
+
+    const times = texts(card, '.nnGXi');
+    train.departure_time = times.length >= 2 ? times[0] : 'N/A';
+    train.arrival_time = times.length >= 2 ? times[1] : 'N/A';
+    train.duration = text(card, '.GVfQw') ?? 'N/A';
+
+    const containers = card.querySelectorAll('.PrZHl');
+    const classes = [];
+    for (let i = 0; i < containers.length; i += 2) {
+        const type = text(containers[i], '.bGfcC');
+        const availability = text(containers[i], '.envfU');
+        if (type === null || availability === null) {
+            continue;
+        }
+        const price = i + 1 < containers.length ? text(containers[i + 1], '.SHHaW') : null;
+        classes.push({type: type, availability: availability, price: price === null ? 'N/A' : price.split('\\n')[0]});
+    }
+    train.classes_and_availability = classes;
+    train.confirmation_chances = texts(card, '.Ob72l');
 
-def cleanup_browsers():
-    """Cleanup all browser instances"""
-    with browser_lock:
-        for thread_id, driver in browser_instances.items():
-            try:
-                logger.info(f"Cleaning up browser instance for thread {thread_id}")
-                driver.quit()
-            except:
-                pass
-        browser_instances.clear()
+    const stations = texts(card, '.pYpdU');
+    train.from_station = stations.length >= 2 ? stations[0] : 'N/A';
+    train.to_station = stations.length >= 2 ? stations[1] : 'N/A';
 
-# Register cleanup function
-atexit.register(cleanup_browsers)
+    trains.push(train);
+    if (target) {
+        break;
+    }
+}
+return {trains: trains, skipped: skipped};
+"""
 
 def extract_train_data(driver, target_train_number=None):
     """
     Extract train data, optionally filtering for a specific train number.
+    The whole results page is read by one script running in the browser.
     """
-    train_data = []
-    train_elements = driver.find_elements(By.CLASS_NAME, "Gwgxn")
     thread_name = threading.current_thread().name
-    logger.info(f"Thread {thread_name}: Found {len(train_elements)} train elements" + 
-                (f", filtering for train {target_train_number}" if target_train_number else ""))
-
-    for train_element in train_elements:
-        train_info = {}
-        
-        try:
-            name_number_element = train_element.find_element(By.CLASS_NAME, "k9j0o")
-            train_info['name'] = name_number_element.find_element(By.TAG_NAME, "h1").text
-            train_info['number'] = name_number_element.find_element(By.CLASS_NAME, "qW4yv").text.strip("()")
-            
-            # Skip if not the target train
-            if target_train_number and train_info['number'] != target_train_number:
-                continue
-                
-            logger.info(f"Thread {thread_name}: Extracting data for train: {train_info['name']} ({train_info['number']})")
-        except NoSuchElementException as e:
-            logger.error(f"Thread {thread_name}: Error extracting train name/number: {str(e)}")
-            continue
-
-        try:
-            time_elements = train_element.find_elements(By.CLASS_NAME, "nnGXi")
-            train_info['departure_time'] = time_elements[0].text
-            train_info['arrival_time'] = time_elements[1].text
-            logger.debug(f"Thread {thread_name}: Found times for {train_info['number']}: {train_info['departure_time']} - {train_info['arrival_time']}")
-        except IndexError:
+    result = driver.execute_script(EXTRACT_TRAINS_SCRIPT, target_train_number) or {}
+    train_data = result.get('trains', [])
+    
+    for card_text in result.get('skipped', []):
+        logger.error(f"Thread {thread_name}: Error extracting train name/number from card: {card_text!r}")
+    for train_info in train_data:
+        if train_info['departure_time'] == "N/A":
             logger.warning(f"Thread {thread_name}: Could not find departure or arrival times for train {train_info['number']}")
-            train_info['departure_time'] = "N/A"
-            train_info['arrival_time'] = "N/A"
-
-        try:
-            duration_element = train_element.find_element(By.CLASS_NAME, "GVfQw")
-            train_info['duration'] = duration_element.text
-        except NoSuchElementException:
-            logger.warning(f"Thread {thread_name}: Could not find journey duration for train {train_info['number']}")
-            train_info['duration'] = "N/A"
-
-        try:
-            class_containers = train_element.find_elements(By.CLASS_NAME, "PrZHl")
-            classes_and_availability = []
-            
-            for i in range(0, len(class_containers), 2):
-                class_info = {}
-                
-                first_container = class_containers[i]
-                try:
-                    class_type_element = first_container.find_element(By.CLASS_NAME, "bGfcC")
-                    class_info['type'] = class_type_element.text
-                    availability_element = first_container.find_element(By.CLASS_NAME, "envfU")
-                    class_info['availability'] = availability_element.text
-                    logger.debug(f"Thread {thread_name}: Found class {class_info['type']} with availability {class_info['availability']}")
-                except NoSuchElementException:
-                    continue  
-                
-                if i + 1 < len(class_containers):
-                    second_container = class_containers[i + 1]
-                    try:
-                        price_element = second_container.find_element(By.CLASS_NAME, "SHHaW")
-                        price_text = price_element.text.split('\n')[0]
-                        class_info['price'] = price_text
-                    except NoSuchElementException:
-                        class_info['price'] = "N/A"
-                else:
-                    class_info['price'] = "N/A"
-                
-                classes_and_availability.append(class_info)
-            
-            train_info['classes_and_availability'] = classes_and_availability
-            
-        except Exception as e:
-            logger.warning(f"Thread {thread_name}: Could not find class and availability information for train {train_info['number']}: {str(e)}")
-            train_info['classes_and_availability'] = []
-
-        try:
-            chance_elements = train_element.find_elements(By.CLASS_NAME, "Ob72l")
-            train_info['confirmation_chances'] = [element.text for element in chance_elements]
-        except NoSuchElementException:
-            logger.warning(f"Thread {thread_name}: Could not find confirmation chances for train {train_info['number']}")
-            train_info['confirmation_chances'] = []
-
-        try:
-            station_elements = train_element.find_elements(By.CLASS_NAME, "pYpdU")
-            train_info['from_station'] = station_elements[0].text
-            train_info['to_station'] = station_elements[1].text
-        except IndexError:
+        if train_info['from_station'] == "N/A":
             logger.warning(f"Thread {thread_name}: Could not find station information for train {train_info['number']}")
-            train_info['from_station'] = "N/A"
-            train_info['to_station'] = "N/A"
+    
+    logger.info(f"Thread {thread_name}: Extracted {len(train_data)} trains" +
+                (f", filtering for train {target_train_number}" if target_train_number else ""))
+    return train_data
 
-        train_data.append(train_info)
-        
-        # If we found our target train, we can stop here
-        if target_train_number and train_info['number'] == target_train_number:
-            break
+def wait_for_trains(driver, timeout=60, cancel_token: CancelToken = None):
+    """Wait for the train list, giving up as soon as the search is cancelled"""
+    if cancel_token is None:
+        return WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.CLASS_NAME, "Gwgxn"))
+        )
+    
+    condition = EC.presence_of_element_located((By.CLASS_NAME, "Gwgxn"))
+    
+    def trains_or_cancelled(d):
+        cancel_token.raise_if_cancelled()
+        return condition(d)
+    
+    return WebDriverWait(driver, cancel_token.timeout_for(timeout), poll_frequency=0.5).until(trains_or_cancelled)
 
-    return train_data
+def stop_page_load(driver):
+    """Stop any in-progress navigation so the browser is free for the next search"""
+    try:
+        driver.execute_script("window.stop();")
+    except Exception:
+        pass
 
-def scrape_train_data(from_station, to_station, date, target_train_number=None, max_retries=3):
-    """Scrape train data using thread-specific browser"""
+def scrape_train_data(from_station, to_station, date, target_train_number=None, max_retries=3, use_cache=True,
+                      cancel_token: CancelToken = None, harvest_stops: bool = False):
+    """
+    Scrape train data with a browser leased from the shared driver pool.
+    Full result pages are served from and stored in the availability cache
+    unless use_cache is False; a target train is picked out of a cached page,
+    and a page loaded for one train is cached whole.
+    With harvest_stops, the same visit also opens the route of every listed
+    train whose stops are not stored yet and saves them in one write; a
+    cached page is loaded again only if it still has unknown trains.
+    Searches that found no trains, or failed after every retry, are kept in
+    the negative cache for a short TTL and answered from it ([] or None)
+    unless use_cache is False.
+    Loaded pages are snapshotted to the page archive when it is enabled.
+    With a cancel_token, page loads and waits are bounded by its deadline and
+    the scrape returns None as soon as it is cancelled.
+    """
     url = f"https://tickets.paytm.com/trains/searchTrains/{from_station}/{to_station}/{date}"
     thread_name = threading.current_thread().name
     
+    if harvest_stops:
+        # Imported here: the route scraper imports this module
+        from train_route_scraper import extract_train_routes, stops_store, store_harvest
+
+    if use_cache:
+        cached_data = availability_cache.get(from_station, to_station, date)
+        if cached_data is not None and harvest_stops and any(
+                not stops_store.has_stops(train.get('number')) for train in cached_data):
+            cached_data = None
+        if cached_data is not None:
+            if target_train_number:
+                return [train for train in cached_data if train.get('number') == target_train_number]
+            return cached_data
+        negative = negative_cache.check(from_station, to_station, date)
+        if negative is not None:
+            return None if negative == FAILED else []
+    
+    # Attempts where the page loaded but no train list ever appeared
+    list_timeouts = 0
     for attempt in range(max_retries):
+        if cancel_token and cancel_token.is_cancelled():
+            logger.info(f"Thread {thread_name}: Search cancelled ({cancel_token.reason}), not loading {url}")
+            return None
+        
+        driver = None
+        lease = None
+        page_loaded = False
         try:
-            driver = get_thread_driver()
+            lease = driver_pool.acquire(cancel_token)
+            driver = lease.driver
             logger.info(f"Thread {thread_name}: Attempt {attempt + 1}: Navigating to URL: {url}" +
                        (f" for train {target_train_number}" if target_train_number else ""))
             
-            driver.get(url)
-            time.sleep(random.uniform(2, 4))
+            page_load_timeout = cancel_token.timeout_for(30) if cancel_token else 30
+            driver.set_page_load_timeout(page_load_timeout)
+            # Only the document load counts against the host: a results page
+            # without trains is a normal answer, not a sign of throttling. A
+            # load cut short by the search deadline is not the host's fault.
+            with rate_limiter.permit(url, cancel_token, count_errors=page_load_timeout >= 30):
+                driver.get(url)
+            page_loaded = True
+            wait_for_trains(driver, 60, cancel_token)
             
+            # Scroll so lazily rendered trains appear, then wait for the list to settle
             driver.execute_script("window.scrollTo(0, document.body.scrollHeight / 2);")
-            time.sleep(random.uniform(1, 2))
-            
-            WebDriverWait(driver, 60).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "Gwgxn"))
-            )
+            wait_for_stable_count(driver, "Gwgxn", cancel_token)
+            if page_archive.enabled:
+                page_archive.save(from_station, to_station, date, driver.page_source)
             
-            train_data = extract_train_data(driver, target_train_number)
+            # Always read the whole list: it is one script either way, and the
+            # caches must not mistake "not this train" for "no trains"
+            train_data = extract_train_data(driver)
+            if harvest_stops:
+                train_routes = extract_train_routes(driver, cancel_token=cancel_token, skip_stored=True,
+                                                    archive_key=(from_station, to_station, date))
+                store_harvest(from_station, to_station, date, train_data if use_cache else None, train_routes)
+            elif use_cache and train_data:
+                availability_cache.put(from_station, to_station, date, train_data)
+            if train_data:
+                negative_cache.record_success(from_station, to_station, date)
+            else:
+                negative_cache.record_empty(from_station, to_station, date)
+            if target_train_number:
+                return [train for train in train_data if train.get('number') == target_train_number]
             return train_data
             
+        except SearchCancelled as e:
+            logger.info(f"Thread {thread_name}: Scrape of {url} cancelled: {str(e)}")
+            if driver:
+                stop_page_load(driver)
+            return None
+            
         except Exception as e:
+            if cancel_token and cancel_token.is_cancelled():
+                logger.info(f"Thread {thread_name}: Scrape of {url} cancelled: {cancel_token.reason}")
+                if driver:
+                    stop_page_load(driver)
+                return None
             logger.error(f"Thread {thread_name}: Error on attempt {attempt + 1}: {str(e)}")
+            if page_loaded and isinstance(e, TimeoutException):
+                list_timeouts += 1
             
-            # Only create new browser instance on fatal errors
-            if "invalid session id" in str(e).lower() or "no such session" in str(e).lower():
-                with browser_lock:
-                    thread_id = threading.get_ident()
-                    if thread_id in browser_instances:
-                        try:
-                            browser_instances[thread_id].quit()
-                        except:
-                            pass
-                        del browser_instances[thread_id]
+            # Only replace the browser on fatal errors
+            if lease and ("invalid session id" in str(e).lower() or "no such session" in str(e).lower()):
+                lease.healthy = False
             
             if attempt == max_retries - 1:
+                # A page that loads every time but never lists a train has no trains
+                if list_timeouts == max_retries:
+                    negative_cache.record_empty(from_station, to_station, date)
+                else:
+                    negative_cache.record_failure(from_station, to_station, date)
                 return None
-            
-            time.sleep(random.uniform(3, 5))
+        
+        finally:
+            if lease:
+                driver_pool.release(lease)
     
     return None
 
@@ -28,12 +28,21 @@ class StationRouteNetwork(nn.Module):
         return self.network(x)
 
 class FastTrainRoutePredictor:
-    def __init__(self, train_stops_file, station_names_file=None):
+    def __init__(self, train_stops_file, station_names_file=None, stops_store=None):
         self.model_file = 'route_predictor.pt'
         
-        # Load train stops data
-        with open(train_stops_file, 'r') as f:
-            self.train_stops = json.load(f)
+        # Reuse the already loaded and pre-parsed stops when a store is given.
+        # Copied under the store lock: scrapers add trains while predictors are built.
+        if stops_store is not None:
+            with stops_store.lock:
+                self.train_stops = dict(stops_store.stops)
+                timetables = list(stops_store.timetables.items())
+            self.station_codes = {number: timetable.station_codes for number, timetable in timetables}
+        else:
+            with open(train_stops_file, 'r') as f:
+                self.train_stops = json.load(f)
+            self.station_codes = {number: tuple(stop['station_code'] for stop in stops)
+                                  for number, stops in self.train_stops.items()}
         
         # Load station names or create default mapping    
         self.station_names = {}
@@ -74,10 +83,10 @@ class FastTrainRoutePredictor:
 
     def _process_train_data(self):
         """Process train stops to build station statistics"""
-        for train_number, stops in self.train_stops.items():
+        for train_number, codes in self.station_codes.items():
+            stops = self.train_stops.get(train_number, [])
             # Count station frequencies
-            for stop in stops:
-                station_code = stop['station_code']
+            for station_code, stop in zip(codes, stops):
                 self.station_stats[station_code]['frequency'] += 1
                 
                 # Store station name if available
@@ -85,10 +94,8 @@ class FastTrainRoutePredictor:
                     self.station_names[station_code] = stop['station_name']
                 
             # Build connections
-            for i, stop1 in enumerate(stops):
-                for stop2 in stops[i+1:]:
-                    station1 = stop1['station_code']
-                    station2 = stop2['station_code']
+            for i, station1 in enumerate(codes):
+                for station2 in codes[i+1:]:
                     self.station_stats[station1]['connections'][station2].add(train_number)
                     self.station_stats[station2]['connections'][station1].add(train_number)
 
@@ -399,8 +406,10 @@ class FastTrainRoutePredictor:
 # Example usage
 if __name__ == "__main__":
     try:
-        # Initialize predictor with station names file if available
-        predictor = FastTrainRoutePredictor('train_stops.json', 'station_names.json')
+        # Initialize predictor with station names file if available; the store
+        # includes stops still in its write-ahead log
+        from train_stops_store import shared_store
+        predictor = FastTrainRoutePredictor('train_stops.json', 'station_names.json', stops_store=shared_store())
         
         # Get instant predictions
         origin = 'NDLS'
@@ -1,79 +1,159 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException
-import time
+from selenium.common.exceptions import TimeoutException
 import logging
-import random
-from train_stops_store import TrainStopsStore
-from queue import Queue
-from threading import Lock, local
-from typing import List, Dict, Optional
-import atexit
-import threading
+import os
+from train_stops_store import normalize_train_number, shared_store
+from typing import List, Optional
+from cancellation import CancelToken, SearchCancelled
+from driver_pool import driver_pool, wait_for_stable_count
+from rate_limiter import rate_limiter
+from train_availability_scraper import availability_cache, extract_train_data
+from page_archive import page_archive
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, 
                    format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize stops store
-stops_store = TrainStopsStore()
-driver_pool = Queue(maxsize=5)
-driver_lock = Lock()
+# Shared with the route finder, so harvested stops are indexed straight away
+stops_store = shared_store()
 
-# Thread-local storage for browser instances
-thread_local = local()
-browser_instances: Dict[int, webdriver.Chrome] = {}
-browser_lock = Lock()
+SEARCH_HOST = "tickets.paytm.com"
 
-def get_random_user_agent():
-    user_agents = [
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15",
-    ]
-    return random.choice(user_agents)
+# Other trains on a page whose routes are read when harvesting is asked for
+# (datacollector --harvest); each costs a throttled modal round trip, so
+# interactive searches leave it off
+HARVEST_LIMIT = int(os.environ.get('ROUTE_HARVEST_LIMIT', 5))
 
-def wait_for_element(driver, by, value, timeout=10):
-    return WebDriverWait(driver, timeout).until(
-        EC.presence_of_element_located((by, value))
-    )
+def wait_for_element(driver, by, value, timeout=10, cancel_token: CancelToken = None):
+    if cancel_token is None:
+        return WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((by, value))
+        )
+    
+    condition = EC.presence_of_element_located((by, value))
+    
+    def element_or_cancelled(d):
+        cancel_token.raise_if_cancelled()
+        return condition(d)
+    
+    return WebDriverWait(driver, cancel_token.timeout_for(timeout), poll_frequency=0.5).until(element_or_cancelled)
+
+def stop_page_load(driver):
+    """Stop any in-progress navigation so the browser is free for the next search"""
+    try:
+        driver.execute_script("window.stop();")
+    except Exception:
+        pass
 
-def extract_train_routes(driver, target_train_number=None):
+# Lists every train card as {index, name, number} in one WebDriver round trip
+LIST_TRAINS_SCRIPT = """
+const trains = [];
+Array.from(document.getElementsByClassName('Gwgxn')).forEach((card, index) => {
+    const nameNumber = card.querySelector('.k9j0o');
+    const name = nameNumber && nameNumber.querySelector('h1');
+    const number = nameNumber && nameNumber.querySelector('.qW4yv');
+    if (name && number) {
+        trains.push({
+            index: index,
+            name: name.innerText.trim(),
+            number: number.innerText.trim().replace(/^[()]+|[()]+$/g, '')
+        });
+    }
+});
+return trains;
+"""
+
+# The "View train route" button of the train card at arguments[0]
+ROUTE_BUTTON_SCRIPT = """
+const card = document.getElementsByClassName('Gwgxn')[arguments[0]];
+return card ? card.querySelector("div[class*='iXty4']") : null;
+"""
+
+# Reads every stop row of the open route modal in one WebDriver round trip
+EXTRACT_STOPS_SCRIPT = """
+const stops = [];
+for (const row of document.querySelectorAll("div[class*='aMT0H']")) {
+    const station = row.querySelector("div[class*='_kZZF']");
+    const name = station && station.querySelector("span[class*='_Hjc4']");
+    const code = station && station.querySelector("span[class*='LlBCs']");
+    if (!name || !code) {
+        continue;
+    }
+    const stop = {
+        station_name: name.innerText.trim(),
+        station_code: code.innerText.trim().replace(/^[()]+|[()]+$/g, '')
+    };
+    const times = row.querySelectorAll("div[class*='brNEO']");
+    if (times.length >= 3) {
+        stop.arrival_time = times[0].innerText.trim();
+        stop.halt_duration = times[1].innerText.trim();
+        stop.departure_time = times[2].innerText.trim();
+    }
+    if (row.innerText.includes('You are boarding here')) {
+        stop.is_boarding_point = true;
+    }
+    if (row.innerText.includes('You are droppping off here')) {
+        stop.is_dropping_point = true;
+    }
+    stops.push(stop);
+}
+return stops;
+"""
+
+def extract_train_routes(driver, target_train_number=None, cancel_token: CancelToken = None,
+                         harvest_limit: int = 0, skip_stored: bool = False, archive_key: Optional[tuple] = None):
     """
     Extract train routes, optionally filtering for a specific train number.
+    Train cards and route stops are each read by a single script in the
+    browser; only opening and closing a train's route modal needs extra
+    round trips.
     Args:
         driver: Selenium WebDriver instance
         target_train_number: Optional train number to filter for
+        cancel_token: Optional token; extraction stops between trains once cancelled
+        harvest_limit: With a target, also read up to this many other trains
+            whose stops are not stored yet
+        skip_stored: Without a target, only read trains whose stops are not stored yet
+        archive_key: (from_station, to_station, date) of the page; when the page
+            archive is enabled, each open route modal is snapshotted under it
     """
     train_routes = []
-    train_elements = driver.find_elements(By.CLASS_NAME, "Gwgxn")
-    logger.info(f"Found {len(train_elements)} train elements" + 
+    trains = driver.execute_script(LIST_TRAINS_SCRIPT) or []
+    logger.info(f"Found {len(trains)} train elements" + 
                 (f", filtering for train {target_train_number}" if target_train_number else ""))
 
-    for train_element in train_elements:
+    if target_train_number:
+        # The target goes first so the harvest can never crowd it out
+        selected = [train for train in trains if train['number'] == target_train_number]
+        if harvest_limit > 0:
+            selected += [
+                train for train in trains
+                if train['number'] != target_train_number and not stops_store.has_stops(train['number'])
+            ][:harvest_limit]
+    elif skip_stored:
+        selected = [train for train in trains if not stops_store.has_stops(train['number'])]
+    else:
+        selected = trains
+
+    for train in selected:
+        if cancel_token and cancel_token.is_cancelled():
+            logger.info(f"Route extraction cancelled ({cancel_token.reason})")
+            break
+        train_info = {'name': train['name'], 'number': train['number']}
+        
         try:
-            train_info = {}
-            name_number_element = train_element.find_element(By.CLASS_NAME, "k9j0o")
-            train_info['name'] = name_number_element.find_element(By.TAG_NAME, "h1").text
-            train_info['number'] = name_number_element.find_element(By.CLASS_NAME, "qW4yv").text.strip("()")
-            
-            # Skip if not the target train
-            if target_train_number and train_info['number'] != target_train_number:
-                continue
-                
             logger.info(f"Extracting route for train: {train_info['name']} ({train_info['number']})")
 
             # Find and click the "View train route" button for this specific train
             view_route_button = WebDriverWait(driver, 20).until(
-                EC.element_to_be_clickable((By.XPATH, 
-                    f"//div[contains(@class, 'Gwgxn') and .//h1[contains(text(), '{train_info['name']}')]]//div[contains(@class, 'iXty4')]"))
+                lambda d: d.execute_script(ROUTE_BUTTON_SCRIPT, train['index'])
             )
             driver.execute_script("arguments[0].scrollIntoView(true);", view_route_button)
-            time.sleep(2)
+            # Opening a route fetches it from the site, so it is paced like a page load
+            rate_limiter.throttle(SEARCH_HOST, cancel_token)
             driver.execute_script("arguments[0].click();", view_route_button)
 
             # Wait for the route information to load
@@ -82,33 +162,9 @@ def extract_train_routes(driver, target_train_number=None):
             )
 
             # Extract route information
-            stops = []
-            stop_rows = driver.find_elements(By.XPATH, "//div[contains(@class, 'aMT0H')]")
-            for row in stop_rows:
-                try:
-                    stop_info = {}
-                    station_info = row.find_element(By.XPATH, ".//div[contains(@class, '_kZZF')]")
-                    stop_info['station_name'] = station_info.find_element(By.XPATH, ".//span[contains(@class, '_Hjc4')]").text
-                    stop_info['station_code'] = station_info.find_element(By.XPATH, ".//span[contains(@class, 'LlBCs')]").text.strip("()")
-
-                    time_elements = row.find_elements(By.XPATH, ".//div[contains(@class, 'brNEO')]")
-                    if len(time_elements) >= 3:
-                        stop_info['arrival_time'] = time_elements[0].text
-                        stop_info['halt_duration'] = time_elements[1].text
-                        stop_info['departure_time'] = time_elements[2].text
-
-                    if "You are boarding here" in row.text:
-                        stop_info['is_boarding_point'] = True
-                    if "You are droppping off here" in row.text:
-                        stop_info['is_dropping_point'] = True
-
-                    stops.append(stop_info)
-                except StaleElementReferenceException:
-                    logger.warning("Stale element encountered, skipping this stop")
-                except Exception as e:
-                    logger.error(f"Error extracting stop info: {str(e)}")
-
-            train_info['stops'] = stops
+            train_info['stops'] = driver.execute_script(EXTRACT_STOPS_SCRIPT) or []
+            if archive_key and page_archive.enabled:
+                page_archive.save(*archive_key, driver.page_source, train_number=train_info['number'])
             train_routes.append(train_info)
 
             # Close the route information modal
@@ -121,11 +177,10 @@ def extract_train_routes(driver, target_train_number=None):
             WebDriverWait(driver, 10).until(
                 EC.invisibility_of_element_located((By.XPATH, "//div[contains(@class, 'QMO26')]"))
             )
-            
-            # If we found our target train, we can stop here
-            if target_train_number and train_info['number'] == target_train_number:
-                break
 
+        except SearchCancelled:
+            logger.info(f"Route extraction cancelled ({cancel_token.reason})")
+            break
         except TimeoutException:
             logger.warning(f"Timed out waiting for route information for train {train_info.get('number', 'unknown')}")
         except Exception as e:
@@ -133,93 +188,101 @@ def extract_train_routes(driver, target_train_number=None):
 
     return train_routes
 
-def get_thread_driver():
-    """Get or create a thread-specific browser instance"""
-    thread_id = threading.get_ident()
-    
-    with browser_lock:
-        if thread_id not in browser_instances:
-            options = Options()
-            options.add_argument("--headless")
-            options.add_argument("--disable-gpu")
-            options.add_argument("--no-sandbox")
-            options.add_argument("--disable-dev-shm-usage")
-            options.add_argument(f"user-agent={get_random_user_agent()}")
-            options.add_experimental_option("excludeSwitches", ["enable-automation"])
-            options.add_experimental_option('useAutomationExtension', False)
-            
-            driver = webdriver.Chrome(options=options)
-            driver.set_page_load_timeout(30)
-            driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
-                "source": """
-                    Object.defineProperty(navigator, 'webdriver', {
-                        get: () => undefined
-                    })
-                """
-            })
-            
-            browser_instances[thread_id] = driver
-            logger.info(f"Created new browser instance for thread {thread_id}")
-            
-        return browser_instances[thread_id]
-
-def cleanup_browsers():
-    """Cleanup all browser instances"""
-    with browser_lock:
-        for thread_id, driver in browser_instances.items():
-            try:
-                logger.info(f"Cleaning up browser instance for thread {thread_id}")
-                driver.quit()
-            except:
-                pass
-        browser_instances.clear()
-
-# Register cleanup function
-atexit.register(cleanup_browsers)
+def store_harvest(from_station, to_station, date, train_data: Optional[List[dict]],
+                  train_routes: Optional[List[dict]]):
+    """
+    Keep everything a page visit read: the full availability list goes to
+    the availability cache and every train's stops to the stops store in
+    one write.
+    """
+    if train_data:
+        availability_cache.put(from_station, to_station, date, train_data)
+    harvested = {
+        route['number']: route['stops']
+        for route in train_routes or []
+        if route.get('stops') and not stops_store.has_stops(route['number'])
+    }
+    if harvested:
+        logger.info(f"✓ Harvested stops for {len(harvested)} trains from {from_station} -> {to_station}")
+        stops_store.add_many_stops(harvested)
 
-def scrape_train_routes(from_station, to_station, date, target_train_number=None, max_retries=3):
-    """Scrape train routes using thread-specific browser"""
-    url = f"https://tickets.paytm.com/trains/searchTrains/{from_station}/{to_station}/{date}"
+def scrape_train_routes(from_station, to_station, date, target_train_number=None, max_retries=3,
+                        cancel_token: CancelToken = None, harvest_limit: int = 0):
+    """
+    Scrape train routes with a browser leased from the shared driver pool.
+    The visit also caches the availability of every listed train. With a
+    target train and a harvest_limit, it also reads up to that many other
+    unknown routes, so later lookups on this page need no page loads. The page and each
+    opened route are snapshotted to the page archive when it is enabled.
+    With a cancel_token, page loads and waits are bounded by its deadline and
+    the scrape returns None as soon as it is cancelled.
+    """
+    url = f"https://{SEARCH_HOST}/trains/searchTrains/{from_station}/{to_station}/{date}"
     
     for attempt in range(max_retries):
+        if cancel_token and cancel_token.is_cancelled():
+            logger.info(f"Search cancelled ({cancel_token.reason}), not loading {url}")
+            return None
+        
+        driver = None
+        lease = None
         try:
-            driver = get_thread_driver()
+            lease = driver_pool.acquire(cancel_token)
+            driver = lease.driver
             logger.info(f"Attempt {attempt + 1}: Navigating to URL: {url}" + 
                        (f" for train {target_train_number}" if target_train_number else ""))
             
-            driver.get(url)
-            time.sleep(random.uniform(2, 4))
-            
-            # Scroll down the page
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight / 2);")
-            time.sleep(random.uniform(1, 2))
+            page_load_timeout = cancel_token.timeout_for(30) if cancel_token else 30
+            driver.set_page_load_timeout(page_load_timeout)
+            # Only the document load counts against the host: a results page
+            # without trains is a normal answer, not a sign of throttling. A
+            # load cut short by the search deadline is not the host's fault.
+            with rate_limiter.permit(url, cancel_token, count_errors=page_load_timeout >= 30):
+                driver.get(url)
             
             # Wait for the train list to load
-            wait_for_element(driver, By.CLASS_NAME, "Gwgxn", timeout=60)
+            wait_for_element(driver, By.CLASS_NAME, "Gwgxn", timeout=60, cancel_token=cancel_token)
+            
+            # Scroll down the page and wait for lazily rendered trains
+            driver.execute_script("window.scrollTo(0, document.body.scrollHeight / 2);")
+            wait_for_stable_count(driver, "Gwgxn", cancel_token)
+            if page_archive.enabled:
+                page_archive.save(from_station, to_station, date, driver.page_source)
             
-            # Extract train routes
-            train_routes = extract_train_routes(driver, target_train_number)
+            # Read availability for the whole list before any modal is opened
+            train_data = extract_train_data(driver)
+            train_routes = extract_train_routes(driver, target_train_number, cancel_token, harvest_limit,
+                                                archive_key=(from_station, to_station, date))
+            store_harvest(from_station, to_station, date, train_data, train_routes)
             
+            if target_train_number:
+                return [route for route in train_routes if route['number'] == target_train_number]
             return train_routes
             
+        except SearchCancelled as e:
+            logger.info(f"Scrape of {url} cancelled: {str(e)}")
+            if driver:
+                stop_page_load(driver)
+            return None
+            
         except Exception as e:
+            if cancel_token and cancel_token.is_cancelled():
+                logger.info(f"Scrape of {url} cancelled: {cancel_token.reason}")
+                if driver:
+                    stop_page_load(driver)
+                return None
             logger.error(f"Error on attempt {attempt + 1}: {str(e)}")
             
-            # Only create new browser instance on fatal errors
-            if "invalid session id" in str(e).lower() or "no such session" in str(e).lower():
-                with browser_lock:
-                    thread_id = threading.get_ident()
-                    if thread_id in browser_instances:
-                        try:
-                            browser_instances[thread_id].quit()
-                        except:
-                            pass
-                        del browser_instances[thread_id]
+            # Only replace the browser on fatal errors
+            if lease and ("invalid session id" in str(e).lower() or "no such session" in str(e).lower()):
+                lease.healthy = False
             
             if attempt == max_retries - 1:
                 return None
-            
-            time.sleep(random.uniform(3, 5))
+        
+        finally:
+            if lease:
+                driver_pool.release(lease)
     
     return None
 
@@ -234,7 +297,7 @@ def extract_train_stops(driver, target_train_number=None):
                 train_number = train.find_element(By.CLASS_NAME, "train-number").text.strip()
                 
                 # Clean the train number (remove any extra text)
-                train_number = train_number.split('(')[-1].replace(')', '').strip()
+                train_number = normalize_train_number(train_number)
                 
                 if target_train_number and train_number != target_train_number:
                     continue
@@ -248,7 +311,7 @@ def extract_train_stops(driver, target_train_number=None):
                 
                 # Click on the train to expand details
                 train.click()
-                time.sleep(1)
+                WebDriverWait(driver, 5).until(lambda d: train.find_elements(By.CLASS_NAME, "stop-info"))
                 
                 stops = []
                 stop_elements = train.find_elements(By.CLASS_NAME, "stop-info")
@@ -284,8 +347,8 @@ def extract_train_stops(driver, target_train_number=None):
         return None
 
 def get_train_stops(train_number: str, from_station: str, to_station: str, date: str) -> Optional[List[dict]]:
-    """Get train stops using thread-specific browser"""
-    train_number = train_number.split('(')[-1].replace(')', '').strip()
+    """Get train stops with a browser leased from the shared driver pool"""
+    train_number = normalize_train_number(train_number)
     
     # Check cache first
     stored_stops = stops_store.get_stops(train_number)
@@ -295,17 +358,17 @@ def get_train_stops(train_number: str, from_station: str, to_station: str, date:
 
     logger.info(f"✗ CACHE MISS: Need to scrape stops for train {train_number}")
     try:
-        driver = get_thread_driver()
-        url = f"https://tickets.paytm.com/trains/searchTrains/{from_station}/{to_station}/{date}"
-        
-        driver.get(url)
-        time.sleep(random.uniform(1, 2))
+        url = f"https://{SEARCH_HOST}/trains/searchTrains/{from_station}/{to_station}/{date}"
         
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CLASS_NAME, "Gwgxn"))
-        )
-        
-        stops = extract_train_stops(driver, train_number)
+        with driver_pool.driver() as driver:
+            with rate_limiter.permit(url):
+                driver.get(url)
+            
+            WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.CLASS_NAME, "Gwgxn"))
+            )
+            
+            stops = extract_train_stops(driver, train_number)
         if stops:
             logger.info(f"✓ Successfully scraped and stored stops for train {train_number}")
             return stops
@@ -1,43 +1,225 @@
 import json
 import os
-from typing import Dict, List, Optional
+import re
+import threading
+from array import array
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+MINUTES_PER_DAY = 24 * 60
+NO_TIME = -1
+
+class TrainTimetable(NamedTuple):
+    """
+    Compact numeric form of a train's stops, built once when the train is
+    loaded or added. Times are minutes since the train left its first
+    station (NO_TIME where the stop has none, e.g. "Start"/"Finish").
+    """
+    station_codes: Tuple[str, ...]
+    arrival_minutes: array
+    departure_minutes: array
+    day_offsets: array
+    halt_minutes: array
+    start_minute: int
+
+    def position(self, station_code: str) -> int:
+        """Index of a station on this train, or -1 if it does not call there"""
+        try:
+            return self.station_codes.index(station_code)
+        except ValueError:
+            return -1
+
+def normalize_train_number(train_number: str) -> str:
+    """Bare train number from stored keys like ' (12325' or '(12325)'"""
+    return train_number.split('(')[-1].replace(')', '').strip()
+
+def station_code(station: str) -> str:
+    """Station code from names like 'NDLS_NewDelhi'; a bare code is returned as is"""
+    return station.split('_')[0]
+
+def clock_minutes(time_str: str) -> Optional[int]:
+    """Convert an 'HH:MM' stop time to minutes past midnight"""
+    match = re.match(r"(\d{1,2}):(\d{2})", (time_str or '').strip())
+    if not match:
+        return None
+    hour, minute = map(int, match.groups())
+    return hour * 60 + minute
+
+def parse_halt_minutes(halt_str: str) -> int:
+    """Convert a halt such as '05 Mins' to minutes; boarding/dropping dates count as 0"""
+    match = re.match(r"(\d+)\s*Min", (halt_str or '').strip())
+    return int(match.group(1)) if match else 0
+
+def build_timetable(stops: List[dict]) -> TrainTimetable:
+    """Normalise raw stop strings into minute offsets, rolling over midnight as times wrap"""
+    arrivals = array('i')
+    departures = array('i')
+    day = 0
+    last_clock = None
+    for stop in stops:
+        for field, values in (('arrival_time', arrivals), ('departure_time', departures)):
+            clock = clock_minutes(stop.get(field, ''))
+            if clock is None:
+                values.append(NO_TIME)
+                continue
+            if last_clock is not None and clock < last_clock:
+                day += 1
+            last_clock = clock
+            values.append(day * MINUTES_PER_DAY + clock)
+
+    # Rebase so the first departure is minute zero
+    start = NO_TIME
+    if stops:
+        start = departures[0] if departures[0] != NO_TIME else arrivals[0]
+    if start != NO_TIME:
+        for values in (arrivals, departures):
+            for i, value in enumerate(values):
+                if value != NO_TIME:
+                    values[i] = value - start
+
+    day_offsets = array('b')
+    for arrival, departure in zip(arrivals, departures):
+        reached = arrival if arrival != NO_TIME else departure
+        day_offsets.append((start + reached) // MINUTES_PER_DAY if reached != NO_TIME and start != NO_TIME else 0)
+
+    return TrainTimetable(
+        station_codes=tuple(stop.get('station_code', '') for stop in stops),
+        arrival_minutes=arrivals,
+        departure_minutes=departures,
+        day_offsets=day_offsets,
+        halt_minutes=array('h', (parse_halt_minutes(stop.get('halt_duration', '')) for stop in stops)),
+        start_minute=start
+    )
+
+# Log records kept before they are folded into the JSON snapshot
+DEFAULT_COMPACT_AFTER = int(os.environ.get('STOPS_COMPACT_AFTER', 200))
+
 class TrainStopsStore:
-    def __init__(self, store_file: str = "train_stops.json"):
+    """
+    Train stops persisted as a JSON snapshot plus an append-only write-ahead
+    log (<store_file>.wal, one JSON record per line). An insert appends only
+    the new train's record, so its cost does not grow with the store. Every
+    compact_after records the snapshot is rewritten to a temporary file and
+    renamed over the old one, then the log is emptied. Loading replays the
+    log over the snapshot and drops a record torn by a crash. Writes are
+    serialised by a lock. Trains are keyed by bare number: keys scraped as
+    ' (12566' are normalised on load and on every lookup and write.
+    """
+
+    def __init__(self, store_file: str = "train_stops.json", compact_after: int = DEFAULT_COMPACT_AFTER,
+                 fsync: bool = True):
         self.store_file = store_file
+        self.wal_file = f"{store_file}.wal"
+        self.compact_after = compact_after
+        self.fsync = fsync
+        self.wal_records = 0
+        self.lock = threading.RLock()
         self.stops: Dict[str, List[dict]] = {}
+        self.timetables: Dict[str, TrainTimetable] = {}
         self.cache_hits = 0
         self.cache_misses = 0
+        self.listeners: List[Callable[[str, List[dict]], None]] = []
         self.load_stops()
 
     def load_stops(self):
-        """Load stored train stops from JSON file"""
-        if os.path.exists(self.store_file):
-            try:
-                with open(self.store_file, 'r') as f:
-                    self.stops = json.load(f)
-                logger.info(f"✓ Loaded {len(self.stops)} train stops from cache file")
-            except Exception as e:
-                logger.error(f"Error loading cache file: {str(e)}")
+        """Load stored train stops from the JSON snapshot and replay the write-ahead log"""
+        with self.lock:
+            if os.path.exists(self.store_file):
+                try:
+                    with open(self.store_file, 'r') as f:
+                        self.stops = {normalize_train_number(number): stops
+                                      for number, stops in json.load(f).items()}
+                    logger.info(f"✓ Loaded {len(self.stops)} train stops from cache file")
+                except Exception as e:
+                    logger.error(f"Error loading cache file: {str(e)}")
+                    self.stops = {}
+            else:
+                logger.info("No cache file found, starting with empty cache")
                 self.stops = {}
-        else:
-            logger.info("No cache file found, starting with empty cache")
-            self.stops = {}
+            self.wal_records = self._replay_log()
+            self.timetables = {number: build_timetable(stops) for number, stops in self.stops.items()}
 
-    def save_stops(self):
-        """Save train stops to JSON file"""
+    def _replay_log(self) -> int:
+        """
+        Apply the write-ahead log to the loaded snapshot; returns the records
+        applied. A record torn by a crash is cut off the end of the log, so
+        new records are never appended after it. A clean log is not written.
+        """
+        if not os.path.exists(self.wal_file):
+            return 0
+        records = 0
+        good_bytes = 0
+        torn = False
         try:
-            with open(self.store_file, 'w') as f:
-                json.dump(self.stops, f, indent=2)
-            logger.info(f"✓ Saved {len(self.stops)} train stops to cache file")
+            with open(self.wal_file, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError("unterminated record")
+                        record = json.loads(line)
+                    except ValueError:
+                        logger.warning(f"Ignoring torn write-ahead log record {records + 1}")
+                        torn = True
+                        break
+                    self._apply(record)
+                    records += 1
+                    good_bytes += len(line)
+            if torn:
+                with open(self.wal_file, 'r+b') as f:
+                    f.truncate(good_bytes)
         except Exception as e:
-            logger.error(f"Error saving cache file: {str(e)}")
+            logger.error(f"Error replaying write-ahead log: {str(e)}")
+        if records:
+            logger.info(f"✓ Replayed {records} write-ahead log records")
+        return records
+
+    def _apply(self, record: dict):
+        train_number = normalize_train_number(record['train'])
+        if record['op'] == 'put':
+            self.stops[train_number] = record['stops']
+        elif record['op'] == 'delete':
+            self.stops.pop(train_number, None)
+
+    def _append(self, records: List[dict]):
+        """Durably append records to the write-ahead log, compacting when it is long"""
+        with self.lock:
+            try:
+                with open(self.wal_file, 'a') as f:
+                    f.write(''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records))
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+            except Exception as e:
+                logger.error(f"Error writing write-ahead log: {str(e)}")
+                return
+            self.wal_records += len(records)
+            if self.wal_records >= self.compact_after:
+                self.save_stops()
+
+    def save_stops(self):
+        """Write a full snapshot atomically and empty the write-ahead log"""
+        with self.lock:
+            temp_file = f"{self.store_file}.tmp"
+            try:
+                with open(temp_file, 'w') as f:
+                    json.dump(self.stops, f, indent=2)
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                os.replace(temp_file, self.store_file)
+                # The log is only dropped once the snapshot holding its records is in place
+                if os.path.exists(self.wal_file):
+                    os.remove(self.wal_file)
+                self.wal_records = 0
+                logger.info(f"✓ Saved {len(self.stops)} train stops to cache file")
+            except Exception as e:
+                logger.error(f"Error saving cache file: {str(e)}")
 
     def get_stops(self, train_number: str) -> Optional[List[dict]]:
         """Get stops for a train number"""
+        train_number = normalize_train_number(train_number)
         stops = self.stops.get(train_number)
         if stops:
             self.cache_hits += 1
@@ -47,14 +229,50 @@ class TrainStopsStore:
             logger.info(f"✗ Cache miss for train {train_number} (hits: {self.cache_hits}, misses: {self.cache_misses})")
         return stops
 
+    def get_timetable(self, train_number: str) -> Optional[TrainTimetable]:
+        """Get the pre-parsed numeric timetable for a train"""
+        return self.timetables.get(normalize_train_number(train_number))
+
     def add_stops(self, train_number: str, stops: List[dict]):
         """Add new train stops"""
-        self.stops[train_number] = stops
+        train_number = normalize_train_number(train_number)
+        timetable = build_timetable(stops)
+        with self.lock:
+            self.timetables[train_number] = timetable
+            self.stops[train_number] = stops
+            self._append([{'op': 'put', 'train': train_number, 'stops': stops}])
         logger.info(f"✓ Added {len(stops)} stops for train {train_number} to cache")
-        self.save_stops()
+        self._notify(train_number, stops)
+
+    def add_many_stops(self, stops_by_train: Dict[str, List[dict]]):
+        """Add stops for several trains with a single log write"""
+        if not stops_by_train:
+            return
+        stops_by_train = {normalize_train_number(number): stops for number, stops in stops_by_train.items()}
+        timetables = {train_number: build_timetable(stops) for train_number, stops in stops_by_train.items()}
+        with self.lock:
+            self.timetables.update(timetables)
+            self.stops.update(stops_by_train)
+            self._append([{'op': 'put', 'train': train_number, 'stops': stops}
+                          for train_number, stops in stops_by_train.items()])
+        logger.info(f"✓ Added stops for {len(stops_by_train)} trains to cache")
+        for train_number, stops in stops_by_train.items():
+            self._notify(train_number, stops)
+
+    def add_listener(self, callback: Callable[[str, List[dict]], None]):
+        """Register a callback invoked with (train_number, stops) on every insert"""
+        self.listeners.append(callback)
+
+    def _notify(self, train_number: str, stops: List[dict]):
+        for callback in self.listeners:
+            try:
+                callback(train_number, stops)
+            except Exception as e:
+                logger.error(f"Error notifying stops listener: {str(e)}")
 
     def has_stops(self, train_number: str) -> bool:
         """Check if stops exist for train"""
+        train_number = normalize_train_number(train_number)
         exists = train_number in self.stops
         if exists:
             logger.debug(f"✓ Found train {train_number} in cache")
@@ -65,21 +283,46 @@ class TrainStopsStore:
         return {
             'hits': self.cache_hits,
             'misses': self.cache_misses,
-            'total_trains': len(self.stops)
+            'total_trains': len(self.stops),
+            'wal_records': self.wal_records
         }
 
     def update_stops(self, train_number: str, stops: List[dict]):
         """Update existing train stops"""
-        if train_number in self.stops:
+        train_number = normalize_train_number(train_number)
+        timetable = build_timetable(stops)
+        with self.lock:
+            if train_number not in self.stops:
+                return False
+            self.timetables[train_number] = timetable
             self.stops[train_number] = stops
-            self.save_stops()
-            return True
-        return False
+            self._append([{'op': 'put', 'train': train_number, 'stops': stops}])
+        self._notify(train_number, stops)
+        return True
 
     def clear_stops(self, train_number: str = None):
         """Clear stops for one train or all trains"""
-        if train_number:
-            self.stops.pop(train_number, None)
-        else:
-            self.stops.clear()
-        self.save_stops() 
\ No newline at end of file
+        with self.lock:
+            if train_number:
+                train_number = normalize_train_number(train_number)
+                self.stops.pop(train_number, None)
+                self.timetables.pop(train_number, None)
+                self._append([{'op': 'delete', 'train': train_number}])
+            else:
+                self.stops.clear()
+                self.timetables.clear()
+                self.save_stops()
+
+_shared_store: Optional[TrainStopsStore] = None
+_shared_store_lock = threading.Lock()
+
+def shared_store() -> TrainStopsStore:
+    """
+    The process-wide stops store. The scrapers and the route finder all
+    write through it, so stops harvested by one are indexed for the others.
+    """
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = TrainStopsStore()
+        return _shared_store
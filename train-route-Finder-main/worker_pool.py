@@ -0,0 +1,135 @@
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, wait as wait_futures
+from typing import Callable, Deque, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = int(os.environ.get('SCRAPE_POOL_WORKERS', 6))
+
+class ScrapePool:
+    """
+    Process-wide, bounded pool of scraping threads. Every search takes a
+    RequestExecutor from it instead of creating its own ThreadPoolExecutor,
+    so the number of threads (and the Chrome instance each one drives) stays
+    fixed however many searches have run.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, thread_name_prefix: str = "ScrapeWorker"):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix,
+                                           initializer=self._mark_worker)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.inline = 0
+        self.queued = 0
+
+    def _mark_worker(self):
+        self.local.is_worker = True
+
+    def in_worker(self) -> bool:
+        """Whether the calling thread is one of the pool's threads"""
+        return getattr(self.local, 'is_worker', False)
+
+    def request(self, max_concurrency: int) -> 'RequestExecutor':
+        """Executor for one search step, running at most max_concurrency tasks at a time"""
+        return RequestExecutor(self, max_concurrency)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get pool statistics"""
+        return {
+            'max_workers': self.max_workers,
+            'submitted': self.submitted,
+            'inline': self.inline,
+            'queued': self.queued
+        }
+
+class RequestExecutor(Executor):
+    """
+    Per-request view of the shared pool with its own concurrency limit.
+    Tasks beyond the limit wait in a local queue until one of the
+    request's tasks finishes. Tasks submitted from a pool thread (a search
+    running inside a batch) run inline, so nested searches never wait on
+    pool threads that are waiting on them.
+    """
+
+    def __init__(self, pool: ScrapePool, max_concurrency: int):
+        self.pool = pool
+        self.max_concurrency = max(1, max_concurrency)
+        self.pending: Deque[Tuple[Future, Callable, tuple, dict]] = deque()
+        self.futures: List[Future] = []
+        self.running = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        if self.pool.in_worker():
+            with self.lock:
+                if self.closed:
+                    raise RuntimeError("cannot schedule new futures after shutdown")
+                self.futures.append(future)
+            with self.pool.lock:
+                self.pool.inline += 1
+            self._run(future, fn, args, kwargs)
+            return future
+
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            self.futures.append(future)
+            self.pending.append((future, fn, args, kwargs))
+            over_limit = self.running >= self.max_concurrency
+        if over_limit:
+            with self.pool.lock:
+                self.pool.queued += 1
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        """Hand queued tasks to the shared pool while under the concurrency limit"""
+        while True:
+            with self.lock:
+                if self.running >= self.max_concurrency or not self.pending:
+                    return
+                task = self.pending.popleft()
+                self.running += 1
+            with self.pool.lock:
+                self.pool.submitted += 1
+            self.pool.executor.submit(self._run_dispatched, *task)
+
+    def _run_dispatched(self, future, fn, args, kwargs):
+        try:
+            self._run(future, fn, args, kwargs)
+        finally:
+            with self.lock:
+                self.running -= 1
+            self._dispatch()
+
+    @staticmethod
+    def _run(future, fn, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        """Stop accepting tasks; optionally cancel the ones still queued"""
+        with self.lock:
+            self.closed = True
+            pending = list(self.pending) if cancel_futures else []
+            if cancel_futures:
+                self.pending.clear()
+            futures = list(self.futures)
+        for future, _, _, _ in pending:
+            future.cancel()
+        if wait:
+            wait_futures(futures)
+
+# Shared by every search in the process
+scrape_pool = ScrapePool()